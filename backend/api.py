@@ -1,104 +1,65 @@
-
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
-from pathlib import Path
+# backend/api.py
+# HTTP API. create_app() assembles the one FastAPI app: CORS once, each
+# router once, and the startup/shutdown hooks that warm caches and close
+# pools. Routes defined in this module hang off `router`.
+import hashlib
+import json
 from typing import Literal
-from fastapi import Query
 from zoneinfo import ZoneInfo
+
 import h3
-import math
+import numpy as np
 from datetime import date, datetime
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
 from .routes.ride_rating import router as ride_rating_router
-from .routes.flow import router as flow_router, _DRIVER_STATS
-# NEW: import the live overlay helper (no circular ref)
-
-app = FastAPI(title="Smart Earner API")
-
-# Mount routers
-app.include_router(ride_rating_router)
-app.include_router(flow_router)
-
-# CORS for Vite
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://localhost:4173",
-        "http://127.0.0.1:4173",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+from .routes.flow import router as flow_router
+from .heatmap.store import STORE as HEATMAP_STORE, get_store as get_heatmap_store
+from .heatmap.geometry import disk_geometry, ring_k_for_radius_km
+from .rating.anchors import warm as warm_anchors
+from .rating.traffic import TRAFFIC_SOURCE, close_async_client as close_traffic_async_client
+from .rating.traffic_model import get_model as get_traffic_model
+from .db import DB_EXECUTOR, POOL as DB_POOL, aquery, query, run_db
+from .metrics import METRICS_ENABLED, REGISTRY, RequestTimingMiddleware, span, timed
+from .migrations import migrate
+from .state.pubsub import driver_topic, get_broker
+from .state.live import LIVE
+from .state.write_behind import LIVE_AGGREGATES
+
+# Vite dev server / preview
+CORS_ORIGINS = [
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "http://localhost:4173",
+    "http://127.0.0.1:4173",
+]
+
+router = APIRouter()
 
 def q(sql, params=()):
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(sql, params).fetchall()
-    return rows
+    return query(sql, params)  # pooled connection (backend/db.py)
 
-@app.get("/earners/{earner_id}/today_extended")
+@router.get("/earners/{earner_id}/today_extended")
 def earner_today_extended(earner_id: str):
     """
     Combine DB-based stats with live simulated driver data.
     """
-    base = {"today_rides": 0, "avg_rating": 0.0}
-
-    if earner_id in _DRIVER_STATS:
-        stats = _DRIVER_STATS[earner_id]
-        rides = stats.get("today_rides", 0)
-        rating = (
-            round(stats["ratings_sum"] / rides, 2)
-            if rides > 0 else 0.0
-        )
-        base.update({
-            "today_rides": rides,
-            "avg_rating": rating
-        })
-    return base
+    live = LIVE.today(earner_id)
+    return {"today_rides": live.accepted, "avg_rating": live.avg_rating}
 
 # --- Unified daily summary endpoint ---
 
-
-# Resolve DB path relative to the repo root (parent of this 'backend' folder)
-REPO_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = REPO_ROOT / "db" / "uber_hackathon_v2.db"
-app = FastAPI(title="Smart Earner API")
-
-# Mount routers
-app.include_router(ride_rating_router)
-app.include_router(flow_router)
-
-# CORS for Vite
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://localhost:4173",
-        "http://127.0.0.1:4173",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-def q(sql, params=()):
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(sql, params).fetchall()
-    return rows
-
-@app.get("/earners/{earner_id}/today_summary")
-def today_summary(earner_id: str):
+@router.get("/earners/{earner_id}/today_summary")
+async def today_summary(earner_id: str):
     """
     Combined daily summary: earnings, rides completed, and average rating.
     """
     today_str = date.today().isoformat()
     # Query historic daily table
-    result = q("""
+    result = await aquery("""
         SELECT 
             COALESCE(SUM(total_net_earnings), 0) AS today_earnings,
             COALESCE(SUM(trips_count + orders_count), 0) AS rides_completed,
@@ -109,28 +70,9 @@ def today_summary(earner_id: str):
     base = result[0] if result else {"today_earnings": 0, "rides_completed": 0, "avg_rating": 0.0}
 
     # Query live aggregates for today
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS live_aggregates (
-                day TEXT NOT NULL,
-                earner_id TEXT NOT NULL,
-                earn_eur REAL NOT NULL DEFAULT 0,
-                minutes REAL NOT NULL DEFAULT 0,
-                rides INTEGER NOT NULL DEFAULT 0,
-                PRIMARY KEY (day, earner_id)
-            );
-        """)
-        row = conn.execute("""
-            SELECT COALESCE(earn_eur, 0) AS earn_eur, COALESCE(rides, 0) AS rides
-            FROM live_aggregates
-            WHERE day = ? AND earner_id = ?;
-        """, (today_str, earner_id)).fetchone()
-        live_earnings = float(row["earn_eur"] if row and row["earn_eur"] is not None else 0.0)
-        live_rides = int(row["rides"] if row and row["rides"] is not None else 0)
-    finally:
-        conn.close()
+    live = await LIVE.today_async(earner_id)
+    live_earnings = live.earn_eur
+    live_rides = live.rides
 
     # Merge base and live aggregates
     merged = {
@@ -140,142 +82,166 @@ def today_summary(earner_id: str):
     }
     return merged
 
-# Resolve DB path relative to the repo root (parent of this 'backend' folder)
-REPO_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = REPO_ROOT / "db" / "uber_hackathon_v2.db"
 
+H3_RES = 8
+EU_AMS = ZoneInfo("Europe/Amsterdam")
+
+def load_heatmap_store():
+    # smoothed agg_h3_dow_hr layer; reloaded later if aggregate_trips.py reruns
+    HEATMAP_STORE.load()
 
-# CORS for Vite
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://127.0.0.1:5173",
-        "http://localhost:4173",
-        "http://127.0.0.1:4173",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def warm_anchor_cache():
+    # backend-owned tables (live_aggregates, ...) exist before any handler runs;
+    # migrate() also refreshes the schema snapshot the hist queries consult
+    migrate()
+    # per-city rating anchors, so /rides/rate never waits on percentile queries
+    warm_anchors()
 
+def load_traffic_model():
+    # offline congestion table, only consulted with TRAFFIC_SOURCE=historical
+    if TRAFFIC_SOURCE == "historical":
+        get_traffic_model()
 
+async def close_traffic_client():
+    await close_traffic_async_client()
 
-H3_RES = 8
-EU_AMS = ZoneInfo("Europe/Amsterdam")
+def close_db_pool():
+    LIVE_AGGREGATES.stop()  # buffered completions go out before the pool closes
+    DB_EXECUTOR.shutdown()
+    DB_POOL.close()
 
-def _cell_center(h):
-    lat, lng = h3.cell_to_latlng(h)
-    return lat, lng
-
-def _km_between(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    from math import radians, sin, cos, asin, sqrt
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return 2 * R * asin(min(1, sqrt(a)))
-
-def _ring_k_for_radius_km(radius_km):
-    HEX_CIRCUMRADIUS_KM_RES8 = 0.65
-    return max(1, int(math.ceil(radius_km / HEX_CIRCUMRADIUS_KM_RES8)) + 1)
-
-def _val(conn, h, dow, hour, weight):
-    row = conn.execute(
-        "SELECT cnt, earn, surge FROM agg_h3_dow_hr WHERE h3=? AND dow=? AND hour=?",
-        (h, dow, hour),
-    ).fetchone()
-    if not row:
-        return 0.0
-    if weight == "count":
-        return float(row[0] or 0)
-    if weight == "earnings":
-        return float(row[1] or 0)
-    if weight == "surge":
-        return float(row[2] or 0)
-    return 0.0
-
-@app.get("/heatmap/predict")
-def predict_heatmap(
+STARTUP_HOOKS = (load_heatmap_store, warm_anchor_cache, load_traffic_model)
+SHUTDOWN_HOOKS = (close_traffic_client, close_db_pool)
+
+GRID_BINARY_MEDIA_TYPE = "application/octet-stream"
+
+@timed("heatmap.serialize_binary")
+def _grid_binary(geo, sel, values, mx, headers):
+    """
+    Packed grid-mode body: count x uint64 H3 index, then count x float32
+    normalised value, both little-endian. Boundaries are left out (the client
+    derives them from the index); request metadata goes in X-Heatmap-* headers.
+    """
+    norm = values / mx if mx else np.zeros_like(values)
+    body = geo.h3_ints[sel].astype("<u8").tobytes() + norm.astype("<f4").tobytes()
+    return Response(content=body, media_type=GRID_BINARY_MEDIA_TYPE, headers=headers)
+
+@timed("heatmap.cells")
+def _select_cells(lat, lng, radius_km):
+    c = h3.latlng_to_cell(lat, lng, H3_RES)
+    geo = disk_geometry(c, ring_k_for_radius_km(radius_km))  # LRU-cached per (cell, k)
+    sel = geo.within(lat, lng, radius_km)
+    return geo, sel, [geo.cells[i] for i in sel]
+
+def _predict_response(lat, lng, ts_local, radius_km, weight, mode, binary, store, dow_db, hour):
+    """Cell selection, value gather and body encoding for /heatmap/predict.
+    Runs in the threadpool: a geometry-cache miss at 20 km (~3,200 cells) and
+    the per-cell JSON are tens of ms of CPU that must not hold the event loop."""
+    geo, sel, cells = _select_cells(lat, lng, radius_km)
+
+    # smoothing (hour +/- 1, ring-1 neighbours) is precomputed; this is one
+    # in-memory gather
+    with span("heatmap.values"):
+        values = store.smoothed(cells, dow_db, hour, weight)
+        mx = float(values.max()) if len(values) else 1.0
+
+    if mode == "grid" and binary:
+        return _grid_binary(geo, sel, values, mx, {
+            "X-Heatmap-Count": str(len(cells)),
+            "X-Heatmap-When-Local": ts_local.isoformat(),
+            "X-Heatmap-Radius-Km": str(radius_km),
+            "X-Heatmap-Weight": weight,
+            "Vary": "Accept",
+        })
+
+    with span("heatmap.serialize"):
+        norm_vals = [(0.0 if mx == 0 else v / mx) for v in values.tolist()]
+        centers = geo.centers[sel].tolist()
+        body = {
+            "center": [lat, lng],
+            "when_local": ts_local.isoformat(),
+            "radius_km": radius_km,
+            "weight": weight,
+            "count": len(cells),
+        }
+        if mode == "heat":
+            body["points"] = [[clat, clng, v] for (clat, clng), v in zip(centers, norm_vals)]
+        else:
+            body["cells"] = [
+                {"h3": h, "value": v, "center": center, "boundary": boundary}
+                for h, v, center, boundary in zip(cells, norm_vals, centers, geo.boundaries(sel))
+            ]
+        # rendered here, not by FastAPI on the event loop (plain lists/floats/str)
+        return JSONResponse(body, headers={"Vary": "Accept"})
+
+@router.get("/heatmap/predict")
+async def predict_heatmap(
     lat: float = Query(...),
     lng: float = Query(...),
     when: str = Query(..., description="ISO time, e.g. 2025-10-04T17:00:00+02:00"),
     radius_km: float = Query(3.0, ge=0.3, le=20.0),
     weight: Literal["count", "earnings", "surge"] = "count",
     mode: Literal["heat", "grid"] = "grid",
+    accept: str | None = Header(None),
 ):
+    """
+    Grid mode answers with the packed binary layout (see _grid_binary) when
+    the client sends `Accept: application/octet-stream`; JSON otherwise.
+    Both carry `Vary: Accept` so caches keep the two representations apart.
+    """
     ts = datetime.fromisoformat(when)
     if ts.tzinfo is None:
         ts = ts.replace(tzinfo=EU_AMS)
     ts_local = ts.astimezone(EU_AMS)
-    dow = ts_local.weekday()
-    hour = ts_local.hour
-    dow_db = (dow + 1) % 7
+    dow_db = (ts_local.weekday() + 1) % 7
 
-    c = h3.latlng_to_cell(lat, lng, H3_RES)
-    k = _ring_k_for_radius_km(radius_km)
-    candidate = h3.grid_disk(c, k)
-
-    cells = []
-    for h in candidate:
-        clat, clng = _cell_center(h)
-        if _km_between(lat, lng, clat, clng) <= radius_km + 1e-6:
-            cells.append(h)
-
-    conn = sqlite3.connect(DB_PATH)
-    values = []
-    for h in cells:
-        v0 = _val(conn, h, dow_db, (hour - 1) % 24, weight)
-        v1 = _val(conn, h, dow_db, hour, weight)
-        v2 = _val(conn, h, dow_db, (hour + 1) % 24, weight)
-        base = 0.25 * v0 + 0.5 * v1 + 0.25 * v2
-        neigh_vals = []
-        for nh in h3.grid_disk(h, 1):
-            if nh == h:
-                continue
-            nv1 = _val(conn, nh, dow_db, hour, weight)
-            if nv1 > 0:
-                neigh_vals.append(nv1)
-        if neigh_vals:
-            base = 0.8 * base + 0.2 * (sum(neigh_vals) / len(neigh_vals))
-        values.append(base)
-    mx = max(values) if values else 1.0
-    norm_vals = [(0.0 if mx == 0 else v / mx) for v in values]
-    conn.close()
-
-    if mode == "heat":
-        points = []
-        for h, v in zip(cells, norm_vals):
-            clat, clng = _cell_center(h)
-            points.append([clat, clng, v])
-        return {
-            "center": [lat, lng],
-            "when_local": ts_local.isoformat(),
-            "radius_km": radius_km,
-            "weight": weight,
-            "count": len(points),
-            "points": points,
-        }
+    # only a reload after aggregate_trips.py touches disk
+    store = await run_db(get_heatmap_store) if HEATMAP_STORE.needs_reload() else HEATMAP_STORE
+    binary = bool(accept) and GRID_BINARY_MEDIA_TYPE in accept
+    return await run_in_threadpool(
+        _predict_response, lat, lng, ts_local, radius_km, weight, mode, binary, store, dow_db, ts_local.hour
+    )
+
+@router.get("/heatmap/timeline")
+def heatmap_timeline(
+    lat: float = Query(...),
+    lng: float = Query(...),
+    day: date = Query(..., description="Local (Europe/Amsterdam) date, e.g. 2025-10-04"),
+    hours: list[int] | None = Query(None, description="Local hours 0..23; omit for the whole day"),
+    radius_km: float = Query(3.0, ge=0.3, le=20.0),
+    weight: Literal["count", "earnings", "surge"] = "count",
+):
+    """
+    Grid heatmap for several hour slots of one day in one call: the cell
+    geometry is sent once and `values[i][j]` is cell i at hours[j], normalised
+    per slot exactly like /heatmap/predict.
+    """
+    hours = list(range(24)) if not hours else hours
+    if any(h < 0 or h > 23 for h in hours):
+        raise HTTPException(status_code=400, detail="hours_out_of_range")
+    dow_db = (day.weekday() + 1) % 7
+
+    geo, sel, cells = _select_cells(lat, lng, radius_km)
+    with span("heatmap.values"):
+        values = get_heatmap_store().slots(cells, dow_db, hours, weight)  # (cells, slots)
+        mx = values.max(axis=0, initial=0.0)
+        norm = np.divide(values, mx, out=np.zeros_like(values), where=mx > 0)
 
-    grid_cells = []
-    for h, v in zip(cells, norm_vals):
-        boundary = h3.cell_to_boundary(h)
-        grid_cells.append({
-            "h3": h,
-            "value": v,
-            "center": _cell_center(h),
-            "boundary": [[latb, lngb] for (latb, lngb) in boundary],
-        })
     return {
         "center": [lat, lng],
-        "when_local": ts_local.isoformat(),
+        "day": day.isoformat(),
         "radius_km": radius_km,
         "weight": weight,
-        "count": len(grid_cells),
-        "cells": grid_cells,
+        "hours": hours,
+        "count": len(cells),
+        "cells": [
+            {"h3": h, "center": center, "boundary": boundary}
+            for h, center, boundary in zip(cells, geo.centers[sel].tolist(), geo.boundaries(sel))
+        ],
+        "values": np.round(norm, 4).tolist(),
     }
 
-@app.get("/earners/{earner_id}/today")
+@router.get("/earners/{earner_id}/today")
 def earner_today(earner_id: str):
     today_str = date.today().isoformat()
     # base (historic daily table)
@@ -287,29 +253,11 @@ def earner_today(earner_id: str):
     base = float(result[0]["today_earnings"] if result else 0.0)
 
     # live overlay (persistent table)
-    conn = sqlite3.connect(str(DB_PATH))
-    try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS live_aggregates (
-                day TEXT NOT NULL,
-                earner_id TEXT NOT NULL,
-                earn_eur REAL NOT NULL DEFAULT 0,
-                minutes REAL NOT NULL DEFAULT 0,
-                rides INTEGER NOT NULL DEFAULT 0,
-                PRIMARY KEY (day, earner_id)
-            );
-        """)
-        row = conn.execute("""
-            SELECT COALESCE(earn_eur, 0) FROM live_aggregates
-            WHERE day = ? AND earner_id = ?;
-        """, (today_str, earner_id)).fetchone()
-        live = float(row[0] if row and row[0] is not None else 0.0)
-    finally:
-        conn.close()
+    live = LIVE.today(earner_id).earn_eur
 
     return {"today_earnings": round(base + live, 2)}
 
-@app.get("/earners/{earner_id}/today_time")
+@router.get("/earners/{earner_id}/today_time")
 def earner_today_time(earner_id: str):
     today_str = date.today().isoformat()
     result = q("""
@@ -320,31 +268,114 @@ def earner_today_time(earner_id: str):
     base_minutes = float(result[0]["minutes"] if result else 0.0)
 
     # live overlay (persistent)
-    conn = sqlite3.connect(str(DB_PATH))
-    try:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS live_aggregates (
-                day TEXT NOT NULL,
-                earner_id TEXT NOT NULL,
-                earn_eur REAL NOT NULL DEFAULT 0,
-                minutes REAL NOT NULL DEFAULT 0,
-                rides INTEGER NOT NULL DEFAULT 0,
-                PRIMARY KEY (day, earner_id)
-            );
-        """)
-        row = conn.execute("""
-            SELECT COALESCE(minutes, 0) FROM live_aggregates
-            WHERE day = ? AND earner_id = ?;
-        """, (today_str, earner_id)).fetchone()
-        live_minutes = float(row[0] if row and row[0] is not None else 0.0)
-    finally:
-        conn.close()
+    live_minutes = LIVE.today(earner_id).minutes
 
     total_minutes = base_minutes + live_minutes
     hours = round(total_minutes / 60.0, 2)
     return {"today_time_hours": hours}
 
-@app.get("/earners/top")
+# earnings_daily totals + incentives for one (earner, day) in a single round
+# trip (incentives come back as a JSON array column); the live overlay is
+# read from the live store
+DASHBOARD_SQL = """
+    WITH base AS (
+        SELECT
+            COALESCE(SUM(total_net_earnings), 0) AS earn,
+            COALESCE(SUM(rides_duration_mins + eats_duration_mins), 0) AS minutes,
+            COALESCE(SUM(trips_count + orders_count), 0) AS rides,
+            ROUND(AVG(avg_rating), 2) AS avg_rating
+        FROM earnings_daily
+        WHERE earner_id = :earner AND date = :day
+    )
+    SELECT
+        base.earn, base.minutes, base.rides, base.avg_rating,
+        (
+            SELECT json_group_array(json_object(
+                'week', week, 'program', program, 'target_jobs', target_jobs,
+                'completed_jobs', completed_jobs, 'achieved', achieved, 'bonus_eur', bonus_eur
+            ))
+            FROM (SELECT * FROM incentives_weekly WHERE earner_id = :earner ORDER BY week DESC)
+        ) AS incentives
+    FROM base;
+"""
+
+def _dashboard_body(earner_id: str) -> dict:
+    day = date.today().isoformat()
+    row = q(DASHBOARD_SQL, {"earner": earner_id, "day": day})[0]
+    rec = LIVE.today(earner_id)
+    live = {
+        "earn_eur": round(rec.earn_eur, 2),
+        "minutes": rec.minutes,
+        "rides": rec.rides,
+        "session_rides": rec.accepted,
+        "session_avg_rating": rec.avg_rating,
+    }
+    minutes = float(row["minutes"]) + live["minutes"]
+    body = {
+        "earner_id": earner_id,
+        "day": day,
+        "today_earnings": round(float(row["earn"]) + rec.earn_eur, 2),
+        "rides_completed": int(row["rides"]) + live["rides"],
+        "avg_rating": float(row["avg_rating"] or 0.0),
+        "today_minutes": round(minutes, 1),
+        "today_time_hours": round(minutes / 60.0, 2),
+        "live": live,
+        "incentives": json.loads(row["incentives"] or "[]"),
+    }
+    return body
+
+@router.get("/earners/{earner_id}/dashboard")
+def earner_dashboard(earner_id: str, if_none_match: str | None = Header(None)):
+    """
+    Everything the driver dashboard shows in one response: today's earnings,
+    minutes, rides and rating (earnings_daily + live overlay), today's
+    accepted-offer stats and weekly incentives. Carries an ETag; a poll with a
+    matching If-None-Match gets an empty 304.
+    """
+    body = _dashboard_body(earner_id)
+    payload = json.dumps(body, separators=(",", ":"), sort_keys=True).encode()
+    etag = '"' + hashlib.blake2b(payload, digest_size=12).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # always revalidate
+    if if_none_match and etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+SSE_KEEPALIVE_S = 15.0
+
+@router.get("/earners/{earner_id}/stream")
+async def earner_stream(earner_id: str, request: Request):
+    """
+    Server-sent events: a `stats` event with the dashboard body on connect and
+    again whenever flow complete/decision changes this driver's numbers.
+    Between changes the stream only sends a keep-alive comment.
+    """
+    sub = get_broker().subscribe(driver_topic(earner_id))
+
+    async def events():
+        seq = 0
+        try:
+            while True:
+                body = await run_db(_dashboard_body, earner_id)
+                seq += 1
+                yield f"event: stats\nid: {seq}\ndata: {json.dumps(body, separators=(',', ':'))}\n\n"
+                while True:
+                    event = await sub.get(timeout=SSE_KEEPALIVE_S)
+                    if await request.is_disconnected():
+                        return
+                    if event is not None:
+                        sub.drain()  # a burst of changes -> one snapshot
+                        break
+                    yield ": keep-alive\n\n"
+        finally:
+            get_broker().unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/earners/top")
 def top_earners(limit: int = 10):
     return q("""
         SELECT driver_id AS earner_id, SUM(net_earnings) AS net
@@ -354,7 +385,7 @@ def top_earners(limit: int = 10):
         LIMIT ?;
     """, (limit,))
 
-@app.get("/earners/{earner_id}/daily")
+@router.get("/earners/{earner_id}/daily")
 def earner_daily(earner_id: str, limit: int = 14):
     return q("""
         SELECT date, total_net_earnings, trips_count, orders_count
@@ -364,7 +395,7 @@ def earner_daily(earner_id: str, limit: int = 14):
         LIMIT ?;
     """, (earner_id, limit))
 
-@app.get("/incentives/{earner_id}")
+@router.get("/incentives/{earner_id}")
 def incentives(earner_id: str):
     return q("""
         SELECT week, program, target_jobs, completed_jobs, achieved, bonus_eur
@@ -373,7 +404,7 @@ def incentives(earner_id: str):
         ORDER BY week DESC;
     """, (earner_id,))
 
-@app.get("/nudges/{earner_id}")
+@router.get("/nudges/{earner_id}")
 def get_nudges(earner_id: str):
     sessions = q(
         """
@@ -400,7 +431,7 @@ def get_nudges(earner_id: str):
         nudges.append("It’s getting late. Consider wrapping up soon if you feel tired.")
     return {"nudges": nudges}
 
-@app.get("/forecast/{city_id}/{dow}")
+@router.get("/forecast/{city_id}/{dow}")
 def forecast_for_day(city_id: int, dow: int):
     city = q("SELECT city_name FROM cities WHERE city_id = ?", (city_id,))
     city_name = city[0]["city_name"] if city else f"City {city_id}"
@@ -437,4 +468,35 @@ def forecast_for_day(city_id: int, dow: int):
         "current_surge": current_surge
     }
 
-    
\ No newline at end of file
+    
+
+
+@router.get("/metrics")
+def metrics(format: Literal["prometheus", "json"] = "prometheus"):
+    """
+    Request latency per route and per-stage spans (backend/metrics.py):
+    Prometheus text by default, `?format=json` for p50/p95/p99 at a glance.
+    """
+    if format == "json":
+        return {"enabled": METRICS_ENABLED, **REGISTRY.snapshot()}
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def create_app() -> FastAPI:
+    """The API app: CORS once, each router once, cache warm-up / pool teardown hooks."""
+    app = FastAPI(title="Smart Earner API", on_startup=STARTUP_HOOKS, on_shutdown=SHUTDOWN_HOOKS)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if METRICS_ENABLED:  # outermost, so CORS is part of the measured time
+        app.add_middleware(RequestTimingMiddleware)
+    for r in (ride_rating_router, flow_router, router):
+        app.include_router(r)
+    return app
+
+
+app = create_app()
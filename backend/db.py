@@ -0,0 +1,279 @@
+# backend/db.py
+# Shared location of the SQLite database and the "stamp" files that the
+# scripts/ loaders touch after rewriting a table, so in-memory copies held by
+# the API know when to reload.
+#
+# All backend SQLite access goes through the pool below: connections are
+# opened once (WAL, mmap, large page cache, statement cache) and handed out
+# per request instead of a connect() per query.
+import asyncio
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from .metrics import span
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = REPO_ROOT / "db" / "uber_hackathon_v2.db"
+HIST_STAMP = "hist_data"  # touched by load_from_excel.py / synthesize_rides.py
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+DB_CACHE_KIB = int(os.getenv("DB_CACHE_KIB", str(64 * 1024)))
+DB_STATEMENT_CACHE = 256  # per connection; the backend has a small fixed set of queries
+DB_BUSY_TIMEOUT_S = 10.0
+DB_EXECUTOR_QUEUE = int(os.getenv("DB_EXECUTOR_QUEUE", "256"))
+
+# "memory": offers / live stats / pub-sub live in this process (single worker).
+# "sqlite": they live in SQLite tables so several workers share them
+# (scripts/serve.py); see state/offers.py, state/live.py, state/pubsub.py.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+
+
+def stamp_path(name: str) -> Path:
+    return DB_PATH.parent / f"{name}.stamp"
+
+
+def stamp_mtime(name: str):
+    """mtime (ns) of db/<name>.stamp, or None if the stamp was never written."""
+    try:
+        return os.stat(stamp_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def open_connection(path=None) -> sqlite3.Connection:
+    # check_same_thread=False: a pooled connection is used by whichever
+    # threadpool worker checks it out (one at a time, never concurrently)
+    conn = sqlite3.connect(
+        str(path or DB_PATH),
+        timeout=DB_BUSY_TIMEOUT_S,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+    return conn
+
+
+class ConnectionPool:
+    """
+    At most `size` open connections. A thread keeps the connection it checked
+    out for nested use (query() inside a connection() block reuses it), and
+    idle connections are handed back LIFO so a busy worker tends to get the
+    same warm connection. Checkout blocks when all `size` are in use.
+
+    load_from_excel.py unlinks and recreates the DB file, and a connection
+    keeps reading the old (deleted) inode. Each checkout compares the file's
+    identity with the one the pooled connections were opened on; on a change
+    idle connections are closed and ones still checked out are closed when
+    returned, so the next checkout opens the new file.
+    """
+
+    def __init__(self, path=None, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []  # [(conn, generation)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._file_id = None
+        self._generation = 0
+        self.opened = 0
+        self.resets = 0
+
+    def _db_file_id(self):
+        try:
+            st = os.stat(self.path or DB_PATH)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _check_file(self):
+        # caller holds self._lock
+        file_id = self._db_file_id()
+        if file_id == self._file_id:
+            return []
+        stale = [conn for conn, _ in self._idle]
+        if self._file_id is not None:
+            self.resets += 1
+        self._file_id, self._idle = file_id, []
+        self._generation += 1
+        return stale
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:  # nested: same thread, same connection
+            yield held
+            return
+
+        with span("db.checkout"):  # waiting for a free pool slot
+            self._slots.acquire()
+        try:
+            with self._lock:
+                stale = self._check_file()
+                conn, gen = self._idle.pop() if self._idle else (None, self._generation)
+            for old in stale:
+                old.close()
+            if conn is None:
+                with span("db.connect"):
+                    conn = open_connection(self.path)
+                self.opened += 1
+            self._local.conn = conn
+            try:
+                with span("db.connection"):  # how long the connection was held
+                    yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.conn = None
+                if conn.in_transaction:
+                    conn.rollback()  # never hand out a half-finished write
+                with self._lock:
+                    current = gen == self._generation
+                    if current:
+                        self._idle.append((conn, gen))
+                if not current:
+                    conn.close()  # opened on a DB file that has since been replaced
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "opened": self.opened, "idle": len(self._idle), "resets": self.resets}
+
+
+POOL = ConnectionPool()
+
+
+def connection():
+    """`with connection() as conn:` -- a pooled connection; commit() your writes."""
+    return POOL.connection()
+
+
+def query(sql: str, params=()) -> list:
+    with span("db.query"), POOL.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def execute(sql: str, params=()) -> int:
+    """Single write statement, committed. Returns rowcount."""
+    with span("db.execute"), POOL.connection() as conn:
+        cur = conn.execute(sql, params)
+        conn.commit()
+        return cur.rowcount
+
+
+class DBExecutor:
+    """
+    Where async routes send blocking DB work. DB_POOL_SIZE threads (one warm
+    pooled connection each) instead of Starlette's shared ~40-thread pool, and
+    at most DB_EXECUTOR_QUEUE calls in flight or waiting; beyond that callers
+    wait on the event loop (backpressure) rather than piling up threads.
+    """
+
+    def __init__(self, workers: int = DB_POOL_SIZE, queue: int = DB_EXECUTOR_QUEUE):
+        self.workers = workers
+        self.queue = queue
+        self._pool = None
+        self._slots = {}  # { event loop: asyncio.Semaphore }
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+        return self._pool
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots.setdefault(loop, asyncio.Semaphore(self.queue))
+        with span("db.executor_wait"):  # backpressure: waiting for a queue slot
+            await slots.acquire()
+        try:
+            return await loop.run_in_executor(self._executor(), fn, *args)
+        finally:
+            slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._slots.clear()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+DB_EXECUTOR = DBExecutor()
+
+
+def run_db(fn, *args):
+    """`await run_db(fn, *args)` -- fn runs on the DB executor."""
+    return DB_EXECUTOR.run(fn, *args)
+
+
+async def aquery(sql: str, params=()) -> list:
+    return await DB_EXECUTOR.run(query, sql, params)
+
+
+class SchemaRegistry:
+    """
+    Which tables/columns exist, introspected once instead of a PRAGMA
+    table_info per call. Refreshed at startup, after migrations, and
+    automatically when the load scripts touch the hist_data stamp.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None  # { table: frozenset(columns) }
+        self._stamp = None
+
+    def refresh(self):
+        stamp = stamp_mtime(HIST_STAMP)
+        tables = {}
+        with connection() as conn:
+            names = [r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+            )]
+            for name in names:
+                cols = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+                tables[name] = frozenset(c[1] for c in cols)
+        with self._lock:
+            self._tables, self._stamp = tables, stamp
+        return self
+
+    def _current(self):
+        if self._tables is None:
+            self.refresh()
+        elif stamp_mtime(HIST_STAMP) != self._stamp:
+            # the loaders may have recreated the DB file without the backend's
+            # own tables: put them back (migrate() also refreshes)
+            from .migrations import migrate  # migrations imports this module
+            migrate()
+        return self._tables
+
+    def columns(self, table: str) -> frozenset:
+        return self._current().get(table, frozenset())
+
+    def has_columns(self, table: str, cols) -> bool:
+        names = self.columns(table)
+        return bool(names) and all(c in names for c in cols)
+
+
+SCHEMA = SchemaRegistry()
@@ -0,0 +1,60 @@
+# backend/heatmap/geometry.py
+# Cached disk geometry for the heatmap cell selection step.
+#
+# A request at (lat, lng, radius_km) looks at grid_disk(centre cell, k) with
+# k = ring count for the radius, so (centre cell, k) is the cache key ("radius
+# bucket"): drivers in the same hex with radii in the same bucket share the
+# cell list, centres and boundaries. The exact radius filter is then a
+# vectorized haversine from the request point over the cached centres.
+import math
+from functools import lru_cache
+
+import h3
+import numpy as np
+
+GEOMETRY_CACHE_SIZE = 256
+HEX_CIRCUMRADIUS_KM_RES8 = 0.65
+EARTH_R_KM = 6371.0
+
+
+def ring_k_for_radius_km(radius_km):
+    return max(1, int(math.ceil(radius_km / HEX_CIRCUMRADIUS_KM_RES8)) + 1)
+
+
+def km_from(lat, lng, centers):
+    """Haversine km from one point to an (M, 2) array of [lat, lng]."""
+    lat1, lon1 = np.radians(lat), np.radians(lng)
+    lat2, lon2 = np.radians(centers[:, 0]), np.radians(centers[:, 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_R_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+class DiskGeometry:
+    __slots__ = ("cells", "h3_ints", "centers", "vertices", "vertex_counts")
+
+    def __init__(self, cells):
+        self.cells = tuple(cells)
+        self.h3_ints = np.array([h3.str_to_int(h) for h in self.cells], dtype=np.uint64)
+        self.centers = np.array([h3.cell_to_latlng(h) for h in self.cells], dtype=np.float64).reshape(-1, 2)
+        # boundaries as one padded (M, max vertices, 2) array + per-cell vertex
+        # count (5/6/7+ vary), not nested lists: a 20 km entry is ~0.9 MB
+        # instead of ~3.3 MB. JSON lists are built per request, for the
+        # selected cells only (boundaries())
+        rings = [h3.cell_to_boundary(h) for h in self.cells]
+        self.vertex_counts = np.array([len(r) for r in rings], dtype=np.uint8)
+        self.vertices = np.zeros((len(rings), max((len(r) for r in rings), default=0), 2), dtype=np.float64)
+        for i, r in enumerate(rings):
+            self.vertices[i, :len(r)] = r
+
+    def boundaries(self, sel) -> list:
+        """JSON-ready [[lat, lng], ...] boundary for each index in sel."""
+        return [v[:n] for v, n in zip(self.vertices[sel].tolist(), self.vertex_counts[sel].tolist())]
+
+    def within(self, lat, lng, radius_km) -> np.ndarray:
+        """Indices (in disk order) of the cells whose centre is within radius_km."""
+        return np.flatnonzero(km_from(lat, lng, self.centers) <= radius_km + 1e-6)
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def disk_geometry(center_cell: str, k: int) -> DiskGeometry:
+    return DiskGeometry(h3.grid_disk(center_cell, k))
@@ -0,0 +1,168 @@
+# backend/heatmap/store.py
+# In-memory heatmap layer used by /heatmap/predict.
+#
+# agg_h3_dow_hr is held as a dense tensor of shape (cells, 7, 24, 3):
+#   [row, dow (0=Sun..6=Sat), hour 0..23, metric (cnt, earn, surge)]
+# with a dict index from H3 string -> row. What the API serves is the
+# *smoothed* layer (hour +/- 1 and ring-1 neighbour blend already applied for
+# every dow/hour/metric), which scripts/aggregate_trips.py materialises into
+# db/agg_h3_smoothed.npz. If the sidecar is missing the store builds the same
+# layer from the raw table at load time.
+#
+# Lookups pad with an extra all-zero last row, so cells without data (and
+# padded neighbour slots) read 0.0 like the old per-cell SELECT did for a
+# missing row.
+import sqlite3
+import threading
+
+import h3
+import numpy as np
+
+from ..db import DB_PATH, connection, stamp_mtime
+
+METRIC_INDEX = {"count": 0, "earnings": 1, "surge": 2}
+AGG_STAMP = "agg_h3_dow_hr"  # touched by scripts/aggregate_trips.py
+SMOOTHED_PATH = DB_PATH.parent / "agg_h3_smoothed.npz"
+
+
+def smooth(tensor, rows, neighbour_rows):
+    """
+    Vectorized version of the old per-cell smoothing in predict_heatmap, for
+    all dow/hour/metric slots at once:
+      base = 0.25 * v[hour-1] + 0.5 * v[hour] + 0.25 * v[hour+1]
+      base = 0.8 * base + 0.2 * mean(neighbour v[hour] > 0)   (if any)
+    rows: (M,) row indices, neighbour_rows: (M, 6) row indices (padded with
+    the zero row). Returns (M, 7, 24, 3).
+    """
+    own = tensor[rows]  # (M, 7, 24, 3)
+    base = (
+        0.25 * np.roll(own, 1, axis=2)  # v[hour-1], wraps 0 -> 23
+        + 0.5 * own
+        + 0.25 * np.roll(own, -1, axis=2)
+    )
+    nv = tensor[neighbour_rows]  # (M, 6, 7, 24, 3)
+    pos = nv > 0
+    n = pos.sum(axis=1)
+    mean = np.where(pos, nv, 0.0).sum(axis=1) / np.maximum(n, 1)
+    return np.where(n > 0, 0.8 * base + 0.2 * mean, base)
+
+
+def rows_for(index, cells) -> np.ndarray:
+    zero = len(index)
+    return np.fromiter((index.get(h, zero) for h in cells), dtype=np.int64, count=len(cells))
+
+
+def neighbour_rows_for(index, cells) -> np.ndarray:
+    """(M, 6) rows of each cell's ring-1 neighbours; pentagons pad with the zero row."""
+    zero = len(index)
+    out = np.full((len(cells), 6), zero, dtype=np.int64)
+    for i, h in enumerate(cells):
+        j = 0
+        for nh in h3.grid_disk(h, 1):
+            if nh == h:
+                continue
+            out[i, j] = index.get(nh, zero)
+            j += 1
+    return out
+
+
+def build_smoothed(index, tensor, chunk: int = 512):
+    """
+    Smoothed layer for every cell that can end up non-zero: the cells with
+    data plus their ring-1 neighbours. tensor must carry the zero row last.
+    """
+    cells = set(index)
+    for h in index:
+        cells.update(h3.grid_disk(h, 1))
+    cells = sorted(cells)
+    layer = np.zeros((len(cells), 7, 24, 3), dtype=np.float32)
+    for i in range(0, len(cells), chunk):  # bounds the (chunk, 6, 7, 24, 3) gather
+        part = cells[i:i + chunk]
+        layer[i:i + len(part)] = smooth(tensor, rows_for(index, part), neighbour_rows_for(index, part))
+    return cells, layer
+
+
+def load_raw(conn):
+    """agg_h3_dow_hr -> (index, tensor with trailing zero row)."""
+    try:
+        rows = conn.execute(
+            "SELECT h3, dow, hour, cnt, earn, surge FROM agg_h3_dow_hr"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # table not built yet -> everything reads as 0
+
+    index = {}
+    for r in rows:
+        index.setdefault(r[0], len(index))
+    tensor = np.zeros((len(index) + 1, 7, 24, 3), dtype=np.float64)
+    if rows:
+        ri = np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        dow = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        hour = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+        vals = np.array([[r[3] or 0, r[4] or 0, r[5] or 0] for r in rows], dtype=np.float64)
+        tensor[ri, dow, hour] = vals
+    return index, tensor
+
+
+def write_smoothed(cells, layer, path=SMOOTHED_PATH):
+    np.savez_compressed(path, cells=np.array(cells, dtype=str), layer=layer)
+
+
+def read_smoothed(path=SMOOTHED_PATH):
+    with np.load(path) as f:
+        return f["cells"].tolist(), f["layer"]
+
+
+class HeatmapStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._stamp = None
+        # (index, layer) swapped as one tuple so readers never mix two loads
+        self.data = ({}, np.zeros((1, 7, 24, 3), dtype=np.float32))
+
+    def load(self):
+        stamp = stamp_mtime(AGG_STAMP)
+        if SMOOTHED_PATH.exists():
+            cells, layer = read_smoothed()
+        else:
+            with connection() as conn:
+                index, tensor = load_raw(conn)
+            cells, layer = build_smoothed(index, tensor)
+
+        index = {h: i for i, h in enumerate(cells)}
+        layer = np.concatenate([layer, np.zeros((1, 7, 24, 3), dtype=layer.dtype)])
+        self.data = (index, layer)
+        self._stamp, self._loaded = stamp, True
+
+    def needs_reload(self) -> bool:
+        return not self._loaded or stamp_mtime(AGG_STAMP) != self._stamp
+
+    def maybe_reload(self):
+        """Reload when aggregate_trips.py has rewritten the table since the last load."""
+        if not self._loaded or stamp_mtime(AGG_STAMP) != self._stamp:
+            with self._lock:  # one reload even if many requests notice at once
+                if not self._loaded or stamp_mtime(AGG_STAMP) != self._stamp:
+                    self.load()
+        return self
+
+    def smoothed(self, cells, dow, hour, weight) -> np.ndarray:
+        if not cells:
+            return np.zeros(0, dtype=np.float64)
+        index, layer = self.data
+        return layer[rows_for(index, cells), dow, hour, METRIC_INDEX[weight]].astype(np.float64)
+
+    def slots(self, cells, dow, hours, weight) -> np.ndarray:
+        """(cells, len(hours)) smoothed values for several hours of one dow."""
+        index, layer = self.data
+        if not cells:
+            return np.zeros((0, len(hours)), dtype=np.float64)
+        rows = rows_for(index, cells)
+        return layer[rows, dow][:, hours, METRIC_INDEX[weight]].astype(np.float64)
+
+
+STORE = HeatmapStore()
+
+
+def get_store() -> HeatmapStore:
+    return STORE.maybe_reload()
@@ -0,0 +1,213 @@
+# backend/metrics.py
+# In-process latency metrics, exported in Prometheus text format at /metrics.
+#
+# Two histogram families, both in seconds:
+#   smart_earner_request_seconds{method,route,status}  every HTTP request,
+#       labelled by the route template (/flow/drivers/{driver_id}/next), not
+#       the raw path, so the label set stays small
+#   smart_earner_span_seconds{span}  named stages inside a request:
+#       rate_ride.*, traffic.*, heatmap.*, db.*
+# plus p50/p95/p99 estimates for each series (interpolated from the buckets).
+#
+# With METRICS_ENABLED=0 span() hands back one shared no-op context manager,
+# timed() returns the function unwrapped and create_app() skips the
+# middleware, so the hot paths pay one global check at most.
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# upper bounds (s): 10 us .. 10 s, roughly x2.5 apart (spans are often sub-ms)
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+REQUEST_FAMILY = "smart_earner_request_seconds"
+SPAN_FAMILY = "smart_earner_span_seconds"
+_HELP = {
+    REQUEST_FAMILY: "HTTP request latency by route template",
+    SPAN_FAMILY: "Latency of named stages inside requests",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = BUCKETS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # { (family, ((label, value), ...)): Histogram }
+
+    def observe(self, family: str, labels: tuple, seconds: float):
+        key = (family, labels)
+        with self._lock:
+            h = self._series.get(key)
+            if h is None:
+                h = self._series[key] = Histogram()
+            h.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> dict:
+        """{family: {labels: {"count", "sum", "p50", "p95", "p99"}}} (for JSON debugging)."""
+        out = {}
+        with self._lock:
+            for (family, labels), h in self._series.items():
+                row = {"count": h.count, "sum": round(h.sum, 6)}
+                for q in QUANTILES:
+                    row[f"p{int(q * 100)}"] = round(h.quantile(q), 6)
+                out.setdefault(family, {})[",".join(f"{k}={v}" for k, v in labels)] = row
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            series = sorted(
+                ((f, l, list(h.counts), h.sum, h.count, [h.quantile(q) for q in QUANTILES])
+                 for (f, l), h in self._series.items()),
+                key=lambda s: (s[0], s[1]),
+            )
+        lines = []
+        for family in (REQUEST_FAMILY, SPAN_FAMILY):
+            rows = [s for s in series if s[0] == family]
+            lines.append(f"# HELP {family} {_HELP[family]}")
+            lines.append(f"# TYPE {family} histogram")
+            for _, labels, counts, total, n, _ in rows:
+                base = _labels(labels)
+                cum = 0
+                for bound, c in zip(BUCKETS + ("+Inf",), counts):
+                    cum += c
+                    le = bound if isinstance(bound, str) else repr(bound)
+                    lines.append(f"{family}_bucket{_labels(labels + (('le', le),))} {cum}")
+                lines.append(f"{family}_sum{base} {total:.6f}")
+                lines.append(f"{family}_count{base} {n}")
+            qfamily = family.replace("_seconds", "_quantile_seconds")
+            lines.append(f"# HELP {qfamily} p50/p95/p99 of {family}, estimated from its buckets")
+            lines.append(f"# TYPE {qfamily} gauge")
+            for _, labels, _, _, _, qs in rows:
+                for q, v in zip(QUANTILES, qs):
+                    lines.append(f"{qfamily}{_labels(labels + (('quantile', str(q)),))} {v:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+class _Span:
+    __slots__ = ("labels", "t0")
+
+    def __init__(self, name: str):
+        self.labels = (("span", name),)
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(SPAN_FAMILY, self.labels, time.perf_counter() - self.t0)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str):
+    """`with span("traffic.fetch"): ...` -- times the block into SPAN_FAMILY."""
+    return _Span(name) if METRICS_ENABLED else _NOOP
+
+
+def timed(name: str):
+    """Decorator form of span() for plain and async functions."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with _Span(name):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware: one REQUEST_FAMILY observation per HTTP request,
+    timed to the end of the response body."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")  # set by the router on the shared scope once matched
+            REGISTRY.observe(
+                REQUEST_FAMILY,
+                (("method", scope["method"]), ("route", getattr(route, "path", "unmatched")), ("status", status[0])),
+                time.perf_counter() - t0,
+            )
@@ -0,0 +1,73 @@
+# backend/migrations.py
+# Schema owned by the backend (tables the API writes itself). Applied once at
+# API startup and by scripts/init_db.py / scripts/create_new_tables.py, so
+# request handlers never run DDL. Progress is tracked in PRAGMA user_version;
+# append new steps to MIGRATIONS, never edit an applied one.
+import sqlite3
+
+from .db import SCHEMA, connection
+
+MIGRATIONS = [
+    # 1: live overlay for today's driver stats (flow.driver_complete)
+    """
+    CREATE TABLE IF NOT EXISTS live_aggregates (
+        day TEXT NOT NULL,
+        earner_id TEXT NOT NULL,
+        earn_eur REAL NOT NULL DEFAULT 0,
+        minutes REAL NOT NULL DEFAULT 0,
+        rides INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, earner_id)
+    );
+    """,
+    # 2: accept-side counters, so live_aggregates holds a driver's whole live
+    # record (state/live.py) instead of an unbounded in-memory dict
+    """
+    ALTER TABLE live_aggregates ADD COLUMN accepted INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE live_aggregates ADD COLUMN accepted_earn REAL NOT NULL DEFAULT 0;
+    ALTER TABLE live_aggregates ADD COLUMN ratings_sum REAL NOT NULL DEFAULT 0;
+    """,
+    # 3: shared state for multi-worker runs (STATE_BACKEND=sqlite): offers any
+    # worker can decide, and the event log that relays pub/sub between workers
+    """
+    CREATE TABLE IF NOT EXISTS offers (
+        offer_id TEXT PRIMARY KEY,
+        driver_id TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        decided_at REAL,
+        body TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_offers_status_expires ON offers(status, expires_at);
+    CREATE TABLE IF NOT EXISTS live_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """,
+]
+
+
+def migrate(conn: sqlite3.Connection | None = None) -> int:
+    """Apply pending migrations; returns the resulting schema version."""
+    if conn is None:
+        with connection() as conn:
+            return migrate(conn)
+
+    # several workers may start at once: take the write lock first and read the
+    # version under it, so exactly one of them applies each step
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, sql in enumerate(MIGRATIONS[version:], start=version + 1):
+            for stmt in filter(str.strip, sql.split(";")):
+                conn.execute(stmt)
+            conn.execute(f"PRAGMA user_version = {i}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    SCHEMA.refresh()
+    return max(version, len(MIGRATIONS))
@@ -0,0 +1,95 @@
+# backend/rating/anchors.py
+# Process-wide, per-city cache of the historical anchors rate_ride needs
+# (rider rating / duration / profitability percentiles + hourly surge).
+#
+# Entries live for ANCHOR_TTL_S seconds and are dropped early when a load
+# script touches db/hist_data.stamp (load_from_excel.py, synthesize_rides.py
+# --write-db). warm() fills every city at API startup so the first ratings
+# don't pay for the queries either.
+import os
+import threading
+import time
+
+from ..db import HIST_STAMP, stamp_mtime
+from .hist import (
+    _q,
+    rating_anchors_for_city,
+    duration_anchors_for_city,
+    profitability_anchors_for_city,
+    surge_multipliers_for_city,
+)
+from .quantiles import TRIP_DISTRIBUTIONS
+
+ANCHOR_TTL_S = float(os.getenv("ANCHOR_TTL_S", "900"))
+
+
+class CityAnchors:
+    __slots__ = ("customer", "time", "profitability", "surge_by_hour", "expires_at", "stamp")
+
+    def __init__(self, city_id: int, stamp):
+        self.customer = rating_anchors_for_city(city_id)
+        self.time = duration_anchors_for_city(city_id)
+        self.profitability = profitability_anchors_for_city(city_id)
+        self.surge_by_hour = surge_multipliers_for_city(city_id)
+        self.expires_at = time.monotonic() + ANCHOR_TTL_S
+        self.stamp = stamp
+
+    def surge(self, hour_0_23: int) -> float:
+        return self.surge_by_hour[int(hour_0_23) % 24]
+
+
+_CACHE = {}  # { city_id: CityAnchors }
+_LOCK = threading.Lock()
+_STATS = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def cached_city_anchors(city_id: int):
+    """The cached entry if still valid, else None; never touches the DB."""
+    entry = _CACHE.get(city_id)
+    if entry is not None and entry.stamp == stamp_mtime(HIST_STAMP) and entry.expires_at > time.monotonic():
+        _STATS["hits"] += 1
+        return entry
+    return None
+
+
+def get_city_anchors(city_id: int) -> CityAnchors:
+    stamp = stamp_mtime(HIST_STAMP)
+    entry = _CACHE.get(city_id)
+    if entry is not None and entry.stamp == stamp and entry.expires_at > time.monotonic():
+        _STATS["hits"] += 1
+        return entry
+
+    with _LOCK:  # one fill per city even under concurrent misses
+        entry = _CACHE.get(city_id)
+        if entry is None or entry.stamp != stamp or entry.expires_at <= time.monotonic():
+            _STATS["misses"] += 1
+            entry = _CACHE[city_id] = CityAnchors(city_id, stamp)
+        else:
+            _STATS["hits"] += 1
+    return entry
+
+
+def invalidate(city_id: int | None = None):
+    """Drop one city (or everything); the next rating refills from the DB."""
+    with _LOCK:
+        if city_id is None:
+            _CACHE.clear()
+            TRIP_DISTRIBUTIONS.reset()  # the trip sketches are shared by all cities
+        else:
+            _CACHE.pop(city_id, None)
+        _STATS["invalidations"] += 1
+
+
+def warm(city_ids=None):
+    if city_ids is None:
+        try:
+            city_ids = [int(r["city_id"]) for r in _q("SELECT city_id FROM cities")]
+        except Exception:
+            city_ids = []
+    for cid in city_ids:
+        get_city_anchors(cid)
+    return city_ids
+
+
+def stats() -> dict:
+    return {**_STATS, "cities": sorted(_CACHE), "ttl_s": ANCHOR_TTL_S}
@@ -1,24 +1,16 @@
 # backend/rating/hist.py (append this function)
 from typing import Optional
-import sqlite3
-from pathlib import Path
+from ..db import SCHEMA, query
 from .utils import percentile
-
-REPO_ROOT = Path(__file__).resolve().parents[2]
-DB_PATH = REPO_ROOT / "db" / "uber_hackathon_v2.db"
+from .quantiles import TRIP_DISTRIBUTIONS
 
 def _q(sql: str, params: tuple = ()):
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(sql, params).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [dict(r) for r in query(sql, params)]
 
 def _table_has_columns(table: str, cols: list) -> bool:
+    # answered from the startup schema snapshot, not a PRAGMA per call
     try:
-        pragma = _q(f"PRAGMA table_info({table});")
-        names = {c["name"] for c in pragma}
-        return all(c in names for c in cols)
+        return SCHEMA.has_columns(table, cols)
     except Exception:
         return False
 
@@ -63,62 +55,36 @@ def rating_anchors_for_city(city_id: int) -> dict:
         "p75": percentile(ratings, 75),
     }
 
-def duration_anchors_for_city(city_id: int, sample_limit: int = 1000) -> dict:
+def _trip_distributions():
+    """Full-population sketches, topped up with any trips appended since last time."""
+    # synthesized rows may only carry duration_min (see synthesize_rides.py)
+    if _table_has_columns("rides_trips", ["duration_min"]):
+        expr = "COALESCE(duration_mins, duration_min)"
+    else:
+        expr = "duration_mins"
+    return TRIP_DISTRIBUTIONS.refresh(_q, duration_expr=expr)
+
+def duration_anchors_for_city(city_id: int) -> dict:
     """
-    Returns P25/P50/P75 of trip durations (minutes) for the given city.
-    If no data, return sensible defaults.
+    Returns exact P25/P50/P75 of trip durations (minutes) over all trips of
+    the given city. If no data, return sensible defaults.
     """
-    rows = _q(
-        """
-        SELECT duration_mins
-        FROM rides_trips
-        WHERE duration_mins IS NOT NULL
-          AND duration_mins > 0
-          AND city_id = ?
-        LIMIT ?
-        """,
-        (city_id, sample_limit),
-    )
-    vals = [float(r["duration_mins"]) for r in rows]
-    vals.sort()
-
-    if not vals:
+    anchors = _trip_distributions().duration_anchors(city_id)
+    if not anchors:
         # Defaults chosen for NL trip durations
         return {"p25": 10.0, "p50": 20.0, "p75": 40.0}
+    return anchors
 
-    return {
-        "p25": percentile(vals, 25),
-        "p50": percentile(vals, 50),
-        "p75": percentile(vals, 75),
-    }
-
-def profitability_anchors_for_city(city_id: int, sample_limit: int = 1000) -> dict:
+def profitability_anchors_for_city(city_id: int) -> dict:
     """
-    Returns P25/P50/P75 of net earnings per minute (€/min) for the city.
+    Returns exact P25/P50/P75 of net earnings per minute (€/min) over all
+    trips of the city.
     """
-    rows = _q(
-        """
-        SELECT net_earnings, duration_mins
-        FROM rides_trips
-        WHERE net_earnings IS NOT NULL
-          AND duration_mins > 0
-          AND city_id = ?
-        LIMIT ?
-        """,
-        (city_id, sample_limit),
-    )
-    vals = [float(r["net_earnings"]) / float(r["duration_mins"]) for r in rows]
-    vals.sort()
-
-    if not vals:
+    anchors = _trip_distributions().profitability_anchors(city_id)
+    if not anchors:
         # fallback defaults for NL market
         return {"p25": 0.25, "p50": 0.35, "p75": 0.45}
-
-    return {
-        "p25": percentile(vals, 25),
-        "p50": percentile(vals, 50),
-        "p75": percentile(vals, 75),
-    }
+    return anchors
 
 def surge_multiplier_for_city_hour(city_id: int, hour_0_23: int) -> float:
     """
@@ -145,5 +111,32 @@ def surge_multiplier_for_city_hour(city_id: int, hour_0_23: int) -> float:
     except Exception:
         return 1.0
 
+def surge_multipliers_for_city(city_id: int) -> list:
+    """
+    All 24 hourly surge multipliers for a city in one query (index = hour),
+    with the same per-hour semantics/fallbacks as surge_multiplier_for_city_hour.
+    """
+    out = [1.0] * 24
+    if not _table_has_columns("surge_by_hour", ["city_id", "hour", "surge_multiplier"]):
+        return out
 
-
+    rows = _q(
+        """
+        SELECT hour, surge_multiplier
+        FROM surge_by_hour
+        WHERE city_id = ?
+        ORDER BY ROWID
+        """,
+        (city_id,),
+    )
+    for r in rows:  # later rows win, like ORDER BY ROWID DESC LIMIT 1
+        try:
+            h = int(r["hour"])
+        except Exception:
+            continue
+        if 0 <= h <= 23:
+            try:
+                out[h] = float(r["surge_multiplier"]) or 1.0
+            except Exception:
+                out[h] = 1.0
+    return out
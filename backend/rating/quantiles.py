@@ -0,0 +1,130 @@
+# backend/rating/quantiles.py
+# Exact, full-population trip distributions per city for the rating anchors.
+#
+# Every trip in rides_trips is kept (one float per trip per metric, ~240 KB
+# per 30k trips), so P25/P50/P75 are exact instead of coming from an
+# arbitrary LIMIT 1000 sample. Between load-script runs refresh() only reads
+# rows with a ROWID above the last one seen, so it costs O(new rows). When a
+# script touches db/hist_data.stamp (load_from_excel.py rebuilds rides_trips
+# and restarts ROWIDs at 1) or anchors.invalidate() is called, it starts over.
+import threading
+
+import numpy as np
+
+from ..db import HIST_STAMP, stamp_mtime
+
+
+class QuantileSketch:
+    """Sorted values + an append buffer merged lazily on the next quantile()."""
+
+    __slots__ = ("_sorted", "_pending")
+
+    def __init__(self):
+        self._sorted = np.zeros(0, dtype=np.float64)
+        self._pending = []
+
+    def __len__(self):
+        return len(self._sorted) + len(self._pending)
+
+    def add(self, value: float):
+        self._pending.append(float(value))
+
+    def _merge(self):
+        if self._pending:
+            merged = np.concatenate([self._sorted, np.asarray(self._pending, dtype=np.float64)])
+            merged.sort(kind="stable")  # mostly-sorted input
+            self._sorted, self._pending = merged, []
+        return self._sorted
+
+    def quantile(self, p: float):
+        """Linear-interpolated percentile (0..100), same rule as utils.percentile."""
+        vals = self._merge()
+        n = len(vals)
+        if n == 0:
+            return None
+        if p <= 0:
+            return float(vals[0])
+        if p >= 100:
+            return float(vals[-1])
+        k = (n - 1) * (p / 100.0)
+        f = int(np.floor(k))
+        c = int(np.ceil(k))
+        if f == c:
+            return float(vals[f])
+        return float(vals[f] * (c - k) + vals[c] * (k - f))
+
+    def anchors(self):
+        """{"p25", "p50", "p75"} or None if no values yet."""
+        if not len(self):
+            return None
+        return {"p25": self.quantile(25), "p50": self.quantile(50), "p75": self.quantile(75)}
+
+
+class TripDistributions:
+    """Per-city duration (min) and net-earnings-per-minute sketches over rides_trips."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.duration = {}        # { city_id: QuantileSketch }
+        self.profitability = {}   # { city_id: QuantileSketch }
+        self.last_rowid = 0
+        self.stamp = None  # stamp_mtime(HIST_STAMP) the sketches were built under
+
+    def reset(self):
+        """Forget everything; the next refresh() rereads rides_trips."""
+        with self._lock:
+            self._reset()
+
+    def refresh(self, q, duration_expr: str = "duration_mins"):
+        """
+        Pull trips appended since the last refresh. `q` is hist._q;
+        duration_expr lets the caller fold in alternative duration columns.
+        """
+        with self._lock:
+            stamp = stamp_mtime(HIST_STAMP)
+            # MAX(ROWID) is a b-tree lookup; a shrink means a rebuild the stamp missed
+            max_id = int(q("SELECT COALESCE(MAX(ROWID), 0) AS max_id FROM rides_trips")[0]["max_id"])
+            if stamp != self.stamp or max_id < self.last_rowid:
+                self._reset()
+                self.stamp = stamp
+            if max_id <= self.last_rowid:
+                return self
+
+            rows = q(
+                f"""
+                SELECT city_id, {duration_expr} AS dur, net_earnings
+                FROM rides_trips
+                WHERE ROWID > ?
+                """,
+                (self.last_rowid,),
+            )
+            for r in rows:
+                cid, dur = r["city_id"], r["dur"]
+                if cid is None or dur is None:
+                    continue
+                dur = float(dur)
+                if dur <= 0:
+                    continue
+                self.duration.setdefault(int(cid), QuantileSketch()).add(dur)
+                if r["net_earnings"] is not None:
+                    self.profitability.setdefault(int(cid), QuantileSketch()).add(
+                        float(r["net_earnings"]) / dur
+                    )
+            self.last_rowid = max_id
+            return self
+
+    def duration_anchors(self, city_id: int):
+        with self._lock:
+            s = self.duration.get(city_id)
+            return s.anchors() if s is not None else None
+
+    def profitability_anchors(self, city_id: int):
+        with self._lock:
+            s = self.profitability.get(city_id)
+            return s.anchors() if s is not None else None
+
+
+TRIP_DISTRIBUTIONS = TripDistributions()
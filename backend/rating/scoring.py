@@ -1,8 +1,29 @@
 # backend/rating/scoring.py
 from typing import Tuple
-from .utils import haversine_km, linear_scale, clamp
+import numpy as np
+from .utils import haversine_km, haversine_km_array, linear_scale, linear_scale_array, clamp
 from typing import Optional
 
+# --- reason strings (shared by the scalar and array scorers) ---
+
+def pickup_reason(d_km) -> str:
+    return f"{d_km:.1f} km away"
+
+def customer_reason(rider_rating, p50) -> str:
+    if rider_rating is None:
+        return "No rider rating"
+    return f"Rider {rider_rating:.2f}★ vs city P50 {p50:.2f}★"
+
+def time_reason(est_duration_mins, p25, p75) -> str:
+    return f"Est. {est_duration_mins:.0f} min vs P25 {p25:.0f} / P75 {p75:.0f}"
+
+def profitability_reason(est_net, npm, surge_mult, p25, p75) -> str:
+    if est_net is None:
+        return "Invalid duration"
+    surge_note = f" x{surge_mult:.2f} surge" if surge_mult and surge_mult != 1.0 else ""
+    return f"~€{est_net:.2f} est. (~€{npm:.2f}/min){surge_note} vs P25 {p25:.2f} / P75 {p75:.2f}"
+
+
 def score_pickup(driver_lat, driver_lon, pickup_lat, pickup_lon) -> Tuple[float, str]:
     """
     Piecewise mapping (agreed):
@@ -22,8 +43,7 @@ def score_pickup(driver_lat, driver_lon, pickup_lat, pickup_lon) -> Tuple[float,
     else:
         score = 25.0
 
-    reason = f"{d:.1f} km away"
-    return clamp(score, 0, 100), reason
+    return clamp(score, 0, 100), pickup_reason(d)
 
     
 def score_customer(rider_rating: Optional[float],
@@ -36,7 +56,7 @@ def score_customer(rider_rating: Optional[float],
     Unknown rating => neutral 70.
     """
     if rider_rating is None:
-        return 70.0, "No rider rating"
+        return 70.0, customer_reason(None, None)
 
     p25 = rating_anchors.get("p25") or 4.6
     p50 = rating_anchors.get("p50") or 4.8
@@ -55,8 +75,7 @@ def score_customer(rider_rating: Optional[float],
         score = 90.0 + ( (rider_rating - p75) / max(1e-6, (5.0 - p75)) ) * (100.0 - 90.0)
 
     score = max(0.0, min(100.0, score))
-    reason = f"Rider {rider_rating:.2f}★ vs city P50 {p50:.2f}★"
-    return score, reason
+    return score, customer_reason(rider_rating, p50)
 
 def score_time(anchors: dict, est_duration_mins: float) -> Tuple[float, str]:
     """
@@ -69,9 +88,7 @@ def score_time(anchors: dict, est_duration_mins: float) -> Tuple[float, str]:
     # map est_duration between p25 and p75 → score between 90 and 50
     score = 100 - linear_scale(est_duration_mins, p25, p75, 10, 90)
     score = clamp(score, 0, 100)
-
-    reason = f"Est. {est_duration_mins:.0f} min vs P25 {p25:.0f} / P75 {p75:.0f}"
-    return score, reason
+    return score, time_reason(est_duration_mins, p25, p75)
 
 # add surge_mult param (default 1.0) and mention it in reason
 def score_profitability(anchors: dict,
@@ -79,7 +96,7 @@ def score_profitability(anchors: dict,
                         est_duration_mins: float,
                         surge_mult: float = 1.0) -> tuple[float, str]:
     if est_duration_mins <= 0:
-        return 50.0, "Invalid duration"
+        return 50.0, profitability_reason(None, None, surge_mult, None, None)
 
     # base €1.2/km * surge
     est_net = 1.2 * est_distance_km * max(0.0, surge_mult)
@@ -90,7 +107,95 @@ def score_profitability(anchors: dict,
 
     score = linear_scale(npm, p25, p75, 40, 90)
     score = clamp(score, 0, 100)
+    return score, profitability_reason(est_net, npm, surge_mult, p25, p75)
 
-    surge_note = f" x{surge_mult:.2f} surge" if surge_mult and surge_mult != 1.0 else ""
-    reason = f"~€{est_net:.2f} est. (~€{npm:.2f}/min){surge_note} vs P25 {p25:.2f} / P75 {p75:.2f}"
-    return score, reason
+
+# --- array variants (batch scoring / backtests) ---
+# Same piecewise mappings and operation order as the scalar scorers above, so
+# scores match them exactly element-wise. Each returns a ScoredArray: the
+# scores plus the per-element inputs of its reason formatter, so reason
+# strings are only built for the elements a caller actually asks about.
+
+class ScoredArray:
+    __slots__ = ("scores", "_fmt", "_args")
+
+    def __init__(self, scores, fmt, *args):
+        self.scores = scores
+        self._fmt = fmt
+        self._args = args  # arrays are indexed per element, anything else passed as-is
+
+    def __len__(self):
+        return len(self.scores)
+
+    def reason(self, i: int) -> str:
+        return self._fmt(*(a[i] if isinstance(a, np.ndarray) else a for a in self._args))
+
+    def reasons(self) -> list:
+        return [self.reason(i) for i in range(len(self.scores))]
+
+
+def _customer_reason_or_unknown(rider_rating, p50):
+    return customer_reason(None if np.isnan(rider_rating) else float(rider_rating), p50)
+
+def _profitability_reason_or_invalid(valid, est_net, npm, surge_mult, p25, p75):
+    if not valid:
+        return profitability_reason(None, None, surge_mult, None, None)
+    return profitability_reason(est_net, npm, surge_mult, p25, p75)
+
+
+def score_pickup_array(driver_lat, driver_lon, pickup_lat, pickup_lon) -> ScoredArray:
+    d = haversine_km_array(driver_lat, driver_lon, pickup_lat, pickup_lon)
+    score = np.where(
+        d <= 0.5, linear_scale_array(d, 0.0, 0.5, 100, 95),
+        np.where(
+            d <= 2.0, linear_scale_array(d, 0.5, 2.0, 95, 70),
+            np.where(d <= 5.0, linear_scale_array(d, 2.0, 5.0, 70, 40), 25.0),
+        ),
+    )
+    return ScoredArray(np.clip(score, 0, 100), pickup_reason, d)
+
+def score_customer_array(rider_rating, rating_anchors: dict) -> ScoredArray:
+    """rider_rating: float array with NaN for unknown (-> neutral 70)."""
+    r = np.asarray(rider_rating, dtype=np.float64)
+    p25 = rating_anchors.get("p25") or 4.6
+    p50 = rating_anchors.get("p50") or 4.8
+    p75 = rating_anchors.get("p75") or 4.92
+
+    score = np.where(
+        r <= p25, 35.0 + ((r - 1.0) / max(1e-6, (p25 - 1.0))) * (55.0 - 35.0),
+        np.where(
+            r <= p50, 55.0 + ((r - p25) / max(1e-6, (p50 - p25))) * (70.0 - 55.0),
+            np.where(
+                r <= p75, 70.0 + ((r - p50) / max(1e-6, (p75 - p50))) * (90.0 - 70.0),
+                90.0 + ((r - p75) / max(1e-6, (5.0 - p75))) * (100.0 - 90.0),
+            ),
+        ),
+    )
+    score = np.where(np.isnan(r), 70.0, np.clip(score, 0.0, 100.0))
+    return ScoredArray(score, _customer_reason_or_unknown, r, p50)
+
+def score_time_array(anchors: dict, est_duration_mins) -> ScoredArray:
+    est = np.asarray(est_duration_mins, dtype=np.float64)
+    p25 = anchors.get("p25") or 10.0
+    p75 = anchors.get("p75") or 40.0
+    score = 100 - linear_scale_array(est, p25, p75, 10, 90)
+    return ScoredArray(np.clip(score, 0, 100), time_reason, est, p25, p75)
+
+def score_profitability_array(anchors: dict, est_distance_km, est_duration_mins,
+                              surge_mult=1.0) -> ScoredArray:
+    """Invalid (<= 0) durations score 50, like score_profitability."""
+    dist = np.asarray(est_distance_km, dtype=np.float64)
+    dur = np.asarray(est_duration_mins, dtype=np.float64)
+    surge = np.broadcast_to(np.asarray(surge_mult, dtype=np.float64), dist.shape)
+    est_net = 1.2 * dist * np.maximum(0.0, surge)
+    npm = est_net / np.where(dur > 0, dur, 1.0)
+
+    p25 = anchors.get("p25") or 0.25
+    p75 = anchors.get("p75") or 0.45
+
+    score = np.clip(linear_scale_array(npm, p25, p75, 40, 90), 0, 100)
+    valid = dur > 0
+    return ScoredArray(
+        np.where(valid, score, 50.0),
+        _profitability_reason_or_invalid, valid, est_net, npm, surge, p25, p75,
+    )
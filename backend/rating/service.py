@@ -1,23 +1,71 @@
+import asyncio
+
+import numpy as np
+
 from .models import RideCandidate, RideRating, WEIGHTS
-from .traffic import score_traffic
-from .hist import (
-    rating_anchors_for_city,
-    duration_anchors_for_city,
-    profitability_anchors_for_city,
-    surge_multiplier_for_city_hour,   # NEW
-)
+from .traffic import score_traffic_async, score_traffic_many
+from .anchors import cached_city_anchors, get_city_anchors
+from ..db import run_db
+from ..metrics import span
 from .scoring import (
     score_pickup,
     score_customer,
     score_time,
     score_profitability,
+    score_pickup_array,
+    score_customer_array,
+    score_time_array,
+    score_profitability_array,
 )
 from .utils import clamp, hour_from_iso   # UPDATED: import hour_from_iso
 
+NO_DROPOFF_REASON = "No dropoff provided (neutral score)"
+
+
+def _label_decision(overall: float):
+    if overall >= 85:
+        return "Excellent", "Accept"
+    if overall >= 70:
+        return "Good", "Consider"
+    if overall >= 55:
+        return "Fair", "Consider"
+    return "Poor", "Skip"
+
+
+def _has_dropoff(candidate: RideCandidate) -> bool:
+    return candidate.drop_lat is not None and candidate.drop_lon is not None
+
+
+async def rate_ride_async(candidate: RideCandidate, debug: bool = False) -> RideRating:
+    """
+    Rate one candidate (async routes). Cached anchors are used in place; on a miss
+    the SQLite lookup runs on the DB executor while the traffic call is
+    awaited on the pooled client, so the rating waits for the slower of the
+    two, not their sum.
+    """
+    anchors = cached_city_anchors(candidate.city_id)
+    traffic_job = (
+        score_traffic_async(
+            candidate.pickup_lat, candidate.pickup_lon,
+            candidate.drop_lat, candidate.drop_lon
+        )
+        if _has_dropoff(candidate) else None
+    )
+    # one "inputs" span: anchors and traffic overlap, so they aren't timed apart
+    with span("rate_ride.inputs"):
+        if anchors is None and traffic_job is not None:
+            anchors, traffic = await asyncio.gather(run_db(get_city_anchors, candidate.city_id), traffic_job)
+        else:
+            if anchors is None:
+                anchors = await run_db(get_city_anchors, candidate.city_id)
+            traffic = await traffic_job if traffic_job is not None else (70.0, NO_DROPOFF_REASON)
+    with span("rate_ride.assemble"):
+        return _assemble_rating(candidate, anchors, traffic, debug)
+
 
-def rate_ride(candidate: RideCandidate, debug: bool = False) -> RideRating:
+def _assemble_rating(candidate: RideCandidate, anchors, traffic, debug: bool) -> RideRating:
     # --- customer ---
-    customer_anchors = rating_anchors_for_city(candidate.city_id)
+    customer_anchors = anchors.customer
     cust_score, cust_reason = score_customer(candidate.rider_rating, customer_anchors)
 
     # --- pickup ---
@@ -29,13 +77,13 @@ def rate_ride(candidate: RideCandidate, debug: bool = False) -> RideRating:
     )
 
     # --- time (using historical anchors) ---
-    dur_anchors = duration_anchors_for_city(candidate.city_id)
+    dur_anchors = anchors.time
     time_score, time_reason = score_time(dur_anchors, candidate.est_duration_mins)
 
     # --- profitability (historical anchors) + surge awareness ---
-    prof_anchors = profitability_anchors_for_city(candidate.city_id)
+    prof_anchors = anchors.profitability
     req_hour = int(hour_from_iso(candidate.request_time))  # 0..23
-    surge_mult = surge_multiplier_for_city_hour(candidate.city_id, req_hour)
+    surge_mult = anchors.surge(req_hour)
     prof_score, prof_reason = score_profitability(
         prof_anchors,
         candidate.est_distance_km,
@@ -43,14 +91,8 @@ def rate_ride(candidate: RideCandidate, debug: bool = False) -> RideRating:
         surge_mult=surge_mult,  # NEW
     )
 
-    # --- traffic (live via Google Maps or MOCK) ---
-    if candidate.drop_lat is not None and candidate.drop_lon is not None:
-        traffic_score, traffic_reason = score_traffic(
-            candidate.pickup_lat, candidate.pickup_lon,
-            candidate.drop_lat, candidate.drop_lon
-        )
-    else:
-        traffic_score, traffic_reason = 70.0, "No dropoff provided (neutral score)"
+    # --- traffic (scored by the caller) ---
+    traffic_score, traffic_reason = traffic
 
     # --- combine ---
     breakdown = {
@@ -64,14 +106,7 @@ def rate_ride(candidate: RideCandidate, debug: bool = False) -> RideRating:
     overall = round(clamp(overall, 0, 100), 1)
 
     # Label + decision for the popup
-    if overall >= 85:
-        label, decision = "Excellent", "Accept"
-    elif overall >= 70:
-        label, decision = "Good", "Consider"
-    elif overall >= 55:
-        label, decision = "Fair", "Consider"
-    else:
-        label, decision = "Poor", "Skip"
+    label, decision = _label_decision(overall)
 
     reasons = {
         "profitability": prof_reason,
@@ -99,3 +134,85 @@ def rate_ride(candidate: RideCandidate, debug: bool = False) -> RideRating:
         decision=decision,
         anchors_used=anchors_used,
     )
+
+
+def rate_rides(candidates: list[RideCandidate], debug: bool = False,
+               with_reasons: bool = True) -> list[RideRating]:
+    """
+    Batch version of rate_ride_async for dispatch-side ranking. Candidates are
+    grouped by city so anchors are looked up once per city; the pickup, time,
+    profitability and customer scores are computed as NumPy arrays with the
+    same piecewise mappings. Ratings come back in input order. Reason strings
+    are only formatted when with_reasons is set.
+    """
+    out = [None] * len(candidates)
+    by_city = {}
+    for i, c in enumerate(candidates):
+        by_city.setdefault(c.city_id, []).append(i)
+
+    for city_id, idx in by_city.items():
+        with span("rate_rides.anchors"):
+            anchors = get_city_anchors(city_id)
+        group = [candidates[i] for i in idx]
+
+        def col(name):
+            return np.array([getattr(c, name) for c in group], dtype=np.float64)
+
+        hours = np.array([int(hour_from_iso(c.request_time)) for c in group], dtype=np.int64)
+        surge = np.asarray(anchors.surge_by_hour, dtype=np.float64)[hours % 24]
+        est_dur = col("est_duration_mins")
+        ratings = np.array(
+            [np.nan if c.rider_rating is None else c.rider_rating for c in group], dtype=np.float64
+        )
+
+        scored = {
+            "profitability": score_profitability_array(
+                anchors.profitability, col("est_distance_km"), est_dur, surge
+            ),
+            "time": score_time_array(anchors.time, est_dur),
+            "pickup": score_pickup_array(
+                col("driver_lat"), col("driver_lon"), col("pickup_lat"), col("pickup_lon")
+            ),
+            "customer": score_customer_array(ratings, anchors.customer),
+        }
+
+        # traffic for the whole group goes out as batched matrix calls
+        with_drop = [j for j, c in enumerate(group) if _has_dropoff(c)]
+        traffic = [(70.0, NO_DROPOFF_REASON)] * len(group)
+        with span("rate_rides.traffic"):
+            fetched = score_traffic_many(
+                [(group[j].pickup_lat, group[j].pickup_lon, group[j].drop_lat, group[j].drop_lon) for j in with_drop]
+            )
+        for j, t in zip(with_drop, fetched):
+            traffic[j] = t
+
+        # --- combine (same term order as _assemble_rating) ---
+        breakdown = {k: v.scores for k, v in scored.items()}
+        breakdown["traffic"] = np.array([t[0] for t in traffic], dtype=np.float64)
+        overall = np.clip(sum(breakdown[k] * WEIGHTS[k] for k in WEIGHTS.keys()), 0, 100)
+
+        for j, i in enumerate(idx):
+            ov = round(float(overall[j]), 1)
+            label, decision = _label_decision(ov)
+            reasons = {}
+            if with_reasons:
+                reasons = {k: v.reason(j) for k, v in scored.items()}
+                reasons["traffic"] = traffic[j][1]
+            anchors_used = {}
+            if debug:
+                anchors_used = {
+                    "customer": anchors.customer,
+                    "time": anchors.time,
+                    "profitability": anchors.profitability,
+                    "surge": {"hour": int(hours[j]), "multiplier": float(surge[j])},
+                    "notes": "traffic uses Google Maps (or MOCK_TRAFFIC).",
+                }
+            out[i] = RideRating(
+                overall=ov,
+                breakdown={k: float(breakdown[k][j]) for k in WEIGHTS.keys()},
+                reasons=reasons,
+                label=label,
+                decision=decision,
+                anchors_used=anchors_used,
+            )
+    return out
@@ -1,13 +1,151 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import h3
+import httpx
 import requests
 from dotenv import load_dotenv
+from ..db import run_db
+from ..metrics import timed
+from .traffic_model import MODEL as TRAFFIC_MODEL
+from .traffic_model import get_model as get_traffic_model
 from .utils import clamp, linear_scale
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 MOCK_TRAFFIC = os.getenv("MOCK_TRAFFIC", "false").lower() == "true"
+# "google" (live Distance Matrix) or "historical" (offline model from
+# rides_trips, see traffic_model.py / scripts/build_traffic_model.py)
+TRAFFIC_SOURCE = os.getenv("TRAFFIC_SOURCE", "google").lower()
+
+# TRAFFIC_API_URL lets a local stub (scripts/traffic_stub.py) stand in for Google
+BASE_URL = os.getenv("TRAFFIC_API_URL", "https://maps.googleapis.com/maps/api/distancematrix/json")
+
+# Results are cached per (pickup cell, drop cell, 15-minute bucket): offers in a
+# hot zone mostly share origin/destination cells, so most lookups never leave
+# the process. Concurrent misses on the same key wait for one upstream call.
+TRAFFIC_H3_RES = 8
+TRAFFIC_BUCKET_S = 15 * 60
+TRAFFIC_CACHE_SIZE = int(os.getenv("TRAFFIC_CACHE_SIZE", "4096"))
+TRAFFIC_CACHE_TTL_S = float(os.getenv("TRAFFIC_CACHE_TTL_S", str(TRAFFIC_BUCKET_S)))
+
+# Distance Matrix request limits (standard plan)
+TRAFFIC_MAX_ORIGINS = int(os.getenv("TRAFFIC_MAX_ORIGINS", "25"))
+TRAFFIC_MAX_DESTINATIONS = int(os.getenv("TRAFFIC_MAX_DESTINATIONS", "25"))
+TRAFFIC_MAX_ELEMENTS = int(os.getenv("TRAFFIC_MAX_ELEMENTS", "100"))
+
+# Upstream calls share one pooled connection (keep-alive, no per-call
+# handshake). The async path gives up after TRAFFIC_DEADLINE_S and answers
+# neutral; after TRAFFIC_BREAKER_FAILURES consecutive failures the breaker
+# opens and upstream is skipped for TRAFFIC_BREAKER_COOLDOWN_S.
+TRAFFIC_DEADLINE_S = float(os.getenv("TRAFFIC_DEADLINE_S", "1.5"))
+TRAFFIC_POOL_SIZE = int(os.getenv("TRAFFIC_POOL_SIZE", "20"))
+TRAFFIC_BREAKER_FAILURES = int(os.getenv("TRAFFIC_BREAKER_FAILURES", "5"))
+TRAFFIC_BREAKER_COOLDOWN_S = float(os.getenv("TRAFFIC_BREAKER_COOLDOWN_S", "30"))
+
+_CACHE = OrderedDict()  # { key: (expires_at, (score, reason)) }, LRU order
+_INFLIGHT = {}          # { key: Future } for lookups currently upstream
+_LOCK = threading.Lock()
+_STATS = {"hits": 0, "misses": 0, "coalesced": 0, "upstream_calls": 0,
+          "deadline_exceeded": 0, "breaker_skips": 0}
+_BREAKER = {"failures": 0, "open_until": 0.0}
+
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=TRAFFIC_POOL_SIZE))
+_ASYNC_CLIENT = None  # httpx.AsyncClient, created on first use inside the event loop
+
+
+def _ratio_score(ratio: float) -> float:
+    # Map congestion ratio to score
+    if ratio <= 1.0:
+        score = 95.0
+    elif ratio <= 1.2:
+        score = linear_scale(ratio, 1.0, 1.2, 95, 70)
+    elif ratio <= 1.5:
+        score = linear_scale(ratio, 1.2, 1.5, 70, 40)
+    else:
+        score = 40.0
+    return clamp(score, 0, 100)
+
+
+def _cache_key(pickup_lat, pickup_lon, drop_lat, drop_lon, now=None):
+    bucket = int((time.time() if now is None else now) // TRAFFIC_BUCKET_S)
+    return (
+        h3.latlng_to_cell(pickup_lat, pickup_lon, TRAFFIC_H3_RES),
+        h3.latlng_to_cell(drop_lat, drop_lon, TRAFFIC_H3_RES),
+        bucket,
+    )
+
+
+def _cache_get(key):
+    entry = _CACHE.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        _CACHE.pop(key, None)
+        return None
+    _CACHE.move_to_end(key)
+    return entry[1]
+
+
+def _cache_put(key, result):
+    _CACHE[key] = (time.monotonic() + TRAFFIC_CACHE_TTL_S, result)
+    _CACHE.move_to_end(key)
+    while len(_CACHE) > TRAFFIC_CACHE_SIZE:
+        _CACHE.popitem(last=False)
+
+
+def traffic_cache_stats() -> dict:
+    with _LOCK:
+        return {
+            **_STATS, "size": len(_CACHE), "max_size": TRAFFIC_CACHE_SIZE, "ttl_s": TRAFFIC_CACHE_TTL_S,
+            "breaker_open": _breaker_open(), "consecutive_failures": _BREAKER["failures"],
+        }
+
 
-BASE_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+def _breaker_open() -> bool:
+    return _BREAKER["open_until"] > time.monotonic()
+
+
+def _breaker_record(ok: bool):
+    with _LOCK:
+        if ok:
+            _BREAKER["failures"] = 0
+            return
+        _BREAKER["failures"] += 1
+        if _BREAKER["failures"] >= TRAFFIC_BREAKER_FAILURES:
+            _BREAKER["open_until"] = time.monotonic() + TRAFFIC_BREAKER_COOLDOWN_S
+
+
+def clear_traffic_cache():
+    with _LOCK:
+        _CACHE.clear()
+
+
+def _mock_traffic():
+    # Stable mock for demos
+    base_dur = 20.0
+    traffic_dur = 28.0
+    ratio = traffic_dur / base_dur
+    score = linear_scale(ratio, 1.0, 1.5, 95, 40)
+    return clamp(score, 0, 100), f"[MOCK] Traffic {traffic_dur:.1f}m vs {base_dur:.1f}m free-flow (x{ratio:.2f})"
+
+
+def _historical_traffic(pickup_lat, pickup_lon, drop_lat, drop_lon):
+    return _historical_result(get_traffic_model(), pickup_lat, pickup_lon, drop_lat, drop_lon)
+
+
+@timed("traffic.historical")
+def _historical_result(model, pickup_lat, pickup_lon, drop_lat, drop_lon):
+    hit = model.lookup(pickup_lat, pickup_lon, drop_lat, drop_lon)
+    if hit is None:
+        return 70.0, "No historical traffic for this route (neutral score)"
+    ratio, n, where = hit
+    return _ratio_score(ratio), f"Historical traffic x{ratio:.2f} vs free-flow ({where}, {n} trips)"
 
 
 def score_traffic(pickup_lat, pickup_lon, drop_lat, drop_lon) -> tuple[float, str]:
@@ -16,41 +154,278 @@ def score_traffic(pickup_lat, pickup_lon, drop_lat, drop_lon) -> tuple[float, st
       ratio = duration_in_traffic / base_duration
     Returns (score 0..100, reason string).
     Falls back to neutral 70 if API not configured or errors occur.
-    Set MOCK_TRAFFIC=true in .env to force a stable demo response.
+    Set MOCK_TRAFFIC=true in .env to force a stable demo response, or
+    TRAFFIC_SOURCE=historical to answer from the offline model instead.
+    Live results are cached per (pickup cell, drop cell, 15-min bucket).
+    """
+    return score_traffic_many([(pickup_lat, pickup_lon, drop_lat, drop_lon)])[0]
+
+
+@timed("traffic.score_many")
+def score_traffic_many(pairs) -> list:
+    """
+    score_traffic for many (pickup_lat, pickup_lon, drop_lat, drop_lon) pairs.
+    Cache hits are answered locally, keys already in flight are awaited, and
+    the remaining distinct keys go upstream grouped by shared pickup / drop
+    cell, never paying for unrequested elements (see _plan_batches). Results
+    come back in input order.
     """
     if MOCK_TRAFFIC:
-        # Stable mock for demos
-        base_dur = 20.0
-        traffic_dur = 28.0
-        ratio = traffic_dur / base_dur
-        score = linear_scale(ratio, 1.0, 1.5, 95, 40)
-        return clamp(score, 0, 100), f"[MOCK] Traffic {traffic_dur:.1f}m vs {base_dur:.1f}m free-flow (x{ratio:.2f})"
+        return [_mock_traffic() for _ in pairs]
+    if TRAFFIC_SOURCE == "historical":
+        return [_historical_traffic(*p) for p in pairs]
+    if not API_KEY:
+        return [(70.0, "No API key configured (neutral score)") for _ in pairs]
+
+    now = time.time()
+    keys = [_cache_key(*p, now=now) for p in pairs]
+    results = [None] * len(pairs)
+    waiting = []  # (i, Future) answered by another caller's upstream call
+    owned = {}    # key -> (pair, Future) this call must fetch
+    with _LOCK:
+        for i, key in enumerate(keys):
+            cached = _cache_get(key)
+            if cached is not None:
+                _STATS["hits"] += 1
+                results[i] = cached
+                continue
+            fut = _INFLIGHT.get(key)
+            if fut is None:
+                fut = _INFLIGHT[key] = Future()
+                owned[key] = (pairs[i], fut)
+                _STATS["misses"] += 1
+            else:
+                _STATS["coalesced"] += 1
+            waiting.append((i, fut))
+
+    if owned:
+        try:
+            fetched = _fetch_traffic_many({k: p for k, (p, _) in owned.items()})
+        except BaseException as e:  # never leave waiters hanging
+            fetched = {k: ((70.0, f"Traffic API error: {e}"), False) for k in owned}
+        with _LOCK:
+            for key, (result, cacheable) in fetched.items():
+                if cacheable:
+                    _cache_put(key, result)
+                _INFLIGHT.pop(key, None)
+        for key, (_, fut) in owned.items():
+            fut.set_result(fetched[key][0])
+
+    for i, fut in waiting:
+        results[i] = fut.result()
+    return results
+
 
+def _plan_batches(items):
+    """
+    Pack (key, pair) items into Distance Matrix calls without paying for
+    elements nobody asked for. A call is billed per element (origins x
+    destinations), so a cross product of unrelated pairs would bill N^2
+    elements for N answers. Instead, on the H3 cells of the cache key (the
+    answer is cached per cell pair anyway, so nearby offers from one zone
+    share a pickup even when their coordinates differ):
+      - keys sharing a pickup cell go out as 1 x N calls,
+      - of the rest, keys sharing a drop cell go out as N x 1 calls,
+      - anything left is a single 1 x 1 call.
+    A shared cell is sent as one representative point (the first requested
+    one). Every billed element is one requested key; calls stay within
+    TRAFFIC_MAX_ORIGINS / TRAFFIC_MAX_DESTINATIONS / TRAFFIC_MAX_ELEMENTS.
+    Returns [(entries [(key, origin_idx, dest_idx)], origins, dests)].
+    """
+    by_origin = {}  # pickup cell -> (point, [(key, drop point)])
+    for key, (plat, plon, dlat, dlon) in items:
+        by_origin.setdefault(key[0], (f"{plat},{plon}", []))[1].append((key, f"{dlat},{dlon}"))
+
+    batches, by_dest = [], {}
+    per_row = max(1, min(TRAFFIC_MAX_DESTINATIONS, TRAFFIC_MAX_ELEMENTS))
+    for o, group in by_origin.values():
+        if len(group) == 1:
+            key, d = group[0]
+            by_dest.setdefault(key[1], (d, []))[1].append((key, o))
+            continue
+        for i in range(0, len(group), per_row):  # 1 x N
+            chunk = group[i:i + per_row]
+            batches.append(([(key, 0, j) for j, (key, _) in enumerate(chunk)], [o], [d for _, d in chunk]))
+
+    per_col = max(1, min(TRAFFIC_MAX_ORIGINS, TRAFFIC_MAX_ELEMENTS))
+    for d, group in by_dest.values():  # N x 1 (a lone pair is 1 x 1)
+        for i in range(0, len(group), per_col):
+            chunk = group[i:i + per_col]
+            batches.append(([(key, j, 0) for j, (key, _) in enumerate(chunk)], [o for _, o in chunk], [d]))
+    return batches
+
+
+def _matrix_params(origins, dests) -> dict:
+    return {
+        "origins": "|".join(origins),
+        "destinations": "|".join(dests),
+        "departure_time": "now",
+        "mode": "driving",
+        "traffic_model": "best_guess",
+        "region": "nl",  # bias to Netherlands
+        "key": API_KEY,
+    }
+
+
+def _matrix_results(data, entries, out):
+    """Fan a Distance Matrix response out to { key: ((score, reason), cacheable) }."""
+    # Status checks
+    if data.get("status") != "OK":
+        for key, _, _ in entries:
+            out[key] = ((70.0, f"Traffic API status {data.get('status')}"), False)
+        return False
+    rows = data.get("rows") or []
+    for key, oi, di in entries:
+        try:
+            element = rows[oi]["elements"][di]
+        except (IndexError, KeyError, TypeError):
+            out[key] = ((70.0, "Traffic API returned no elements"), False)
+            continue
+        out[key] = _element_result(element)
+    return True
+
+
+def _upstream_failed(entries, out, reason):
+    for key, _, _ in entries:
+        out[key] = ((70.0, reason), False)
+
+
+BREAKER_OPEN_REASON = "Traffic provider unavailable, circuit open (neutral score)"
+
+
+@timed("traffic.fetch")
+def _fetch_traffic_many(pairs_by_key: dict) -> dict:
+    """Upstream Distance Matrix calls -> { key: ((score, reason), cacheable) }."""
+    out = {}
+    for entries, origins, dests in _plan_batches(pairs_by_key.items()):
+        if _breaker_open():
+            _STATS["breaker_skips"] += 1
+            _upstream_failed(entries, out, BREAKER_OPEN_REASON)
+            continue
+        _STATS["upstream_calls"] += 1
+        try:
+            resp = _SESSION.get(BASE_URL, params=_matrix_params(origins, dests), timeout=5)
+            data = resp.json()
+        except Exception as e:
+            _breaker_record(False)
+            _upstream_failed(entries, out, f"Traffic API error: {e}")
+            continue
+        _breaker_record(_matrix_results(data, entries, out))
+    return out
+
+
+def _async_client() -> httpx.AsyncClient:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None or _ASYNC_CLIENT.is_closed:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(5.0),
+            limits=httpx.Limits(max_connections=TRAFFIC_POOL_SIZE, max_keepalive_connections=TRAFFIC_POOL_SIZE),
+        )
+    return _ASYNC_CLIENT
+
+
+async def close_async_client():
+    """Called on API shutdown; the next async lookup opens a fresh pool."""
+    global _ASYNC_CLIENT
+    client, _ASYNC_CLIENT = _ASYNC_CLIENT, None
+    if client is not None:
+        await client.aclose()
+
+
+def _deadline_result():
+    return 70.0, f"Traffic lookup exceeded {TRAFFIC_DEADLINE_S:g}s deadline (neutral score)"
+
+
+@timed("traffic.fetch_async")
+async def _fetch_traffic_async(key, pair):
+    entries = [(key, 0, 0)]
+    origins, dests = [f"{pair[0]},{pair[1]}"], [f"{pair[2]},{pair[3]}"]
+    out = {}
+    if _breaker_open():
+        _STATS["breaker_skips"] += 1
+        _upstream_failed(entries, out, BREAKER_OPEN_REASON)
+        return out[key]
+    _STATS["upstream_calls"] += 1
+    try:
+        resp = await asyncio.wait_for(
+            _async_client().get(BASE_URL, params=_matrix_params(origins, dests)),
+            timeout=TRAFFIC_DEADLINE_S,
+        )
+        data = resp.json()
+    except asyncio.TimeoutError:
+        _STATS["deadline_exceeded"] += 1
+        _breaker_record(False)
+        return _deadline_result(), False
+    except Exception as e:
+        _breaker_record(False)
+        _upstream_failed(entries, out, f"Traffic API error: {e}")
+        return out[key]
+    _breaker_record(_matrix_results(data, entries, out))
+    return out[key]
+
+
+@timed("traffic.score_async")
+async def score_traffic_async(pickup_lat, pickup_lon, drop_lat, drop_lon) -> tuple[float, str]:
+    """
+    score_traffic for the event loop: same cache and coalescing, but the
+    upstream call goes through the pooled httpx client and is bounded by
+    TRAFFIC_DEADLINE_S, so a slow provider costs the rating at most the
+    deadline and a neutral 70.
+    """
+    if MOCK_TRAFFIC:
+        return _mock_traffic()
+    if TRAFFIC_SOURCE == "historical":
+        # only a (re)load reads SQLite, and that goes to the DB executor
+        model = await run_db(get_traffic_model) if TRAFFIC_MODEL.needs_reload() else TRAFFIC_MODEL
+        return _historical_result(model, pickup_lat, pickup_lon, drop_lat, drop_lon)
     if not API_KEY:
         return 70.0, "No API key configured (neutral score)"
 
+    pair = (pickup_lat, pickup_lon, drop_lat, drop_lon)
+    key = _cache_key(*pair)
+    with _LOCK:
+        cached = _cache_get(key)
+        if cached is not None:
+            _STATS["hits"] += 1
+            return cached
+        fut = _INFLIGHT.get(key)
+        owner = fut is None
+        if owner:
+            fut = _INFLIGHT[key] = Future()
+            _STATS["misses"] += 1
+        else:
+            _STATS["coalesced"] += 1
+    if not owner:
+        # the owner may be a sync batch call with its own 5 s timeout: this
+        # caller still gives up at the deadline (shield: the owner's Future is
+        # not ours to cancel)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), TRAFFIC_DEADLINE_S)
+        except asyncio.TimeoutError:
+            _STATS["deadline_exceeded"] += 1
+            return _deadline_result()
+
     try:
-        params = {
-            "origins": f"{pickup_lat},{pickup_lon}",
-            "destinations": f"{drop_lat},{drop_lon}",
-            "departure_time": "now",
-            "mode": "driving",
-            "traffic_model": "best_guess",
-            "region": "nl",  # bias to Netherlands
-            "key": API_KEY,
-        }
-        resp = requests.get(BASE_URL, params=params, timeout=5)
-        data = resp.json()
+        result, cacheable = await _fetch_traffic_async(key, pair)
+    except BaseException as e:  # never leave waiters hanging (incl. cancellation)
+        result, cacheable = (70.0, f"Traffic API error: {e!r}"), False
+        with _LOCK:
+            _INFLIGHT.pop(key, None)
+        fut.set_result(result)
+        raise
+    with _LOCK:
+        if cacheable:
+            _cache_put(key, result)
+        _INFLIGHT.pop(key, None)
+    fut.set_result(result)
+    return result
 
-        # Status checks
-        if data.get("status") != "OK":
-            return 70.0, f"Traffic API status {data.get('status')}"
-        rows = data.get("rows") or []
-        if not rows or not rows[0].get("elements"):
-            return 70.0, "Traffic API returned no elements"
-        element = rows[0]["elements"][0]
+
+def _element_result(element):
+    """One matrix element -> ((score, reason), cacheable)."""
+    try:
         if element.get("status") != "OK":
-            return 70.0, f"Traffic element status {element.get('status')}"
+            return (70.0, f"Traffic element status {element.get('status')}"), True
 
         base_dur = element["duration"]["value"] / 60.0
         # Some responses may omit duration_in_traffic — fall back to duration
@@ -59,18 +434,8 @@ def score_traffic(pickup_lat, pickup_lon, drop_lat, drop_lon) -> tuple[float, st
 
         ratio = traffic_dur / base_dur if base_dur > 0 else 1.0
 
-        # Map congestion ratio to score
-        if ratio <= 1.0:
-            score = 95.0
-        elif ratio <= 1.2:
-            score = linear_scale(ratio, 1.0, 1.2, 95, 70)
-        elif ratio <= 1.5:
-            score = linear_scale(ratio, 1.2, 1.5, 70, 40)
-        else:
-            score = 40.0
-
         reason = f"Traffic {traffic_dur:.1f}m vs {base_dur:.1f}m free-flow (x{ratio:.2f})"
-        return clamp(score, 0, 100), reason
+        return (_ratio_score(ratio), reason), True
 
     except Exception as e:
-        return 70.0, f"Traffic API error: {e}"
+        return (70.0, f"Traffic API error: {e}"), False
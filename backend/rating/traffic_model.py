@@ -0,0 +1,79 @@
+# backend/rating/traffic_model.py
+# Historical congestion model (TRAFFIC_SOURCE=historical) built offline by
+# scripts/build_traffic_model.py from rides_trips. Held in memory as two
+# dicts, so a lookup is two H3 conversions and a dict get -- no network.
+#
+#   exact:  (pickup res-7, drop res-7, dow, hour) -> (ratio, n)
+#   hourly: (pickup res-7, hour)                  -> (ratio, n)   fallback
+#
+# Reloaded when the build script touches db/traffic_model.stamp.
+import sqlite3
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import h3
+
+from ..db import connection, stamp_mtime
+
+MODEL_RES = 7
+MODEL_STAMP = "traffic_model"  # touched by scripts/build_traffic_model.py
+MODEL_TZ = ZoneInfo("Europe/Amsterdam")  # rides_trips start times are local
+DOW_NAMES = ("Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat")
+
+
+class TrafficModel:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._loaded = False
+        self.exact = {}
+        self.hourly = {}
+
+    def load(self):
+        stamp = stamp_mtime(MODEL_STAMP)
+        exact, hourly = {}, {}
+        try:
+            with connection() as conn:
+                for p7, d7, dow, hour, ratio, n in conn.execute(
+                    "SELECT p7, d7, dow, hour, ratio, n FROM traffic_model"
+                ):
+                    exact[(p7, d7, dow, hour)] = (ratio, n)
+                for p7, hour, ratio, n in conn.execute("SELECT p7, hour, ratio, n FROM traffic_model_hr"):
+                    hourly[(p7, hour)] = (ratio, n)
+        except sqlite3.OperationalError:
+            pass  # model not built yet -> every lookup misses
+        self.exact, self.hourly = exact, hourly
+        self._stamp, self._loaded = stamp, True
+
+    def needs_reload(self) -> bool:
+        return not self._loaded or stamp_mtime(MODEL_STAMP) != self._stamp
+
+    def maybe_reload(self):
+        """Reload when build_traffic_model.py has rewritten the tables since the last load."""
+        if self.needs_reload():
+            with self._lock:
+                if self.needs_reload():
+                    self.load()
+        return self
+
+    def lookup(self, pickup_lat, pickup_lon, drop_lat, drop_lon, when=None):
+        """(ratio, n trips, description) for the route at `when` (default now), or None."""
+        when = when or datetime.now(MODEL_TZ)
+        dow, hour = (when.weekday() + 1) % 7, when.hour  # 0=Sun like SQLite %w
+        p7 = h3.latlng_to_cell(pickup_lat, pickup_lon, MODEL_RES)
+        d7 = h3.latlng_to_cell(drop_lat, drop_lon, MODEL_RES)
+        hit = self.exact.get((p7, d7, dow, hour))
+        if hit is not None:
+            return hit[0], hit[1], f"{DOW_NAMES[dow]} {hour:02d}h, this route"
+        hit = self.hourly.get((p7, hour))
+        if hit is not None:
+            return hit[0], hit[1], f"{hour:02d}h, from this area"
+        return None
+
+
+MODEL = TrafficModel()
+
+
+def get_model() -> TrafficModel:
+    return MODEL.maybe_reload()
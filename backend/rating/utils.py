@@ -1,6 +1,8 @@
 import math
 from datetime import datetime
 
+import numpy as np
+
 def haversine_km(lat1, lon1, lat2, lon2) -> float:
     R = 6371.0
     p1, p2 = math.radians(lat1), math.radians(lat2)
@@ -9,6 +11,20 @@ def haversine_km(lat1, lon1, lat2, lon2) -> float:
     a = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dlmb/2)**2
     return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
 
+def haversine_km_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    haversine_km over arrays (same formula, element-wise). NumPy's vectorized
+    trig can differ from math.* in the last ulp, so distances may differ by
+    ~1e-14 km on rare inputs; everything downstream is the same arithmetic.
+    """
+    R = 6371.0
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2))
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlmb = np.radians(lon2 - lon1)
+    a = np.sin(dphi/2)**2 + np.cos(p1)*np.cos(p2)*np.sin(dlmb/2)**2
+    return R * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
 def clamp(v, lo, hi):
     return max(lo, min(hi, v))
 
@@ -20,6 +36,17 @@ def linear_scale(x, lo, hi, out_lo=0.0, out_hi=100.0):
     frac = (x - lo) / (hi - lo)
     return out_lo + frac * (out_hi - out_lo)
 
+def linear_scale_array(x, lo, hi, out_lo=0.0, out_hi=100.0) -> np.ndarray:
+    """linear_scale over arrays; lo/hi may be scalars or arrays."""
+    x, lo, hi = np.broadcast_arrays(
+        np.asarray(x, dtype=np.float64), np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+    )
+    span = hi - lo
+    frac = (x - lo) / np.where(span > 0, span, 1.0)
+    out = out_lo + frac * (out_hi - out_lo)
+    out = np.where(x <= lo, out_lo, np.where(x >= hi, out_hi, out))
+    return np.where(span <= 0, (out_lo + out_hi) / 2, out)
+
 def percentile(sorted_vals, p: float):
     if not sorted_vals:
         return None
@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Query, HTTPException
 from pydantic import BaseModel
 from random import uniform, randint
-from datetime import datetime, date
+from datetime import datetime
 import time
-import sqlite3
+from ..db import run_db
+from ..state.pubsub import driver_topic, publish
+from ..state.live import LIVE
+from ..state.offers import OFFERS, OFFER_TTL_S, new_offer_id
 from ..rating.models import RideCandidate
-from ..rating.service import rate_ride
+from ..rating.service import rate_ride_async
 
 router = APIRouter(prefix="/flow", tags=["flow"])
-_OFFERS = {}
-_DRIVER_STATS = {}  # Track accepted rides per driver (earnings, rides, avg rating)
 NL_AMS_LAT, NL_AMS_LON = 52.3702, 4.8952
 
 class DecisionIn(BaseModel):
@@ -20,9 +21,9 @@ class DecisionIn(BaseModel):
 def driver_decision(driver_id: str, body: DecisionIn):
     """
     Driver accepts or declines an offer.
-    Tracks accepted rides in _DRIVER_STATS for real-time aggregation.
+    Accepted rides are counted in the live store (state/live.py).
     """
-    offer = _OFFERS.get(body.offer_id)
+    offer = OFFERS.get(body.offer_id)
     if not offer:
         raise HTTPException(status_code=404, detail="offer_not_found")
     if offer["driver_id"] != driver_id:
@@ -32,26 +33,21 @@ def driver_decision(driver_id: str, body: DecisionIn):
     decision = body.decision.lower().strip()
     if decision not in ("accept", "decline"):
         raise HTTPException(status_code=400, detail="invalid_decision")
-    offer["status"] = "accepted" if decision == "accept" else "declined"
+    if not OFFERS.resolve(offer, "accepted" if decision == "accept" else "declined"):
+        return {"offer_id": body.offer_id, "status": offer["status"]}  # expired meanwhile
 
     # Track accepted rides for real-time stats
     if decision == "accept":
         est_earning = round(uniform(8, 20), 2)  # simulate €8–€20 per ride
         rider_rating = offer["candidate"]["rider_rating"]
-        stats = _DRIVER_STATS.setdefault(driver_id, {
-            "today_rides": 0,
-            "today_earnings": 0.0,
-            "ratings_sum": 0.0,
-        })
-        stats["today_rides"] += 1
-        stats["today_earnings"] += est_earning
-        stats["ratings_sum"] += rider_rating
+        LIVE.record_accept(driver_id, est_earning, rider_rating)
 
+    publish(driver_topic(driver_id), {"type": "decision", "offer_id": body.offer_id, "status": offer["status"]})
     return {"offer_id": body.offer_id, "status": offer["status"]}
 # ...existing code...
 
 
-__all__ = ["router", "_DRIVER_STATS"]
+__all__ = ["router"]
 
 
 class CompleteIn(BaseModel):
@@ -63,7 +59,7 @@ def jitter(base, deg=0.02):
     return base + uniform(-deg, deg)
 
 @router.get("/drivers/{driver_id}/next")
-def next_offer(driver_id: str, debug: bool = Query(False)):
+async def next_offer(driver_id: str, debug: bool = Query(False)):
     """
     Simulate a new incoming ride for a given driver.
     The backend randomly generates pickup/dropoff, duration, etc.
@@ -94,65 +90,47 @@ def next_offer(driver_id: str, debug: bool = Query(False)):
         est_duration_mins=est_duration_mins,
     )
 
-    rating = rate_ride(candidate, debug=debug)
+    rating = await rate_ride_async(candidate, debug=debug)
 
-    offer_id = f"offer_{randint(100000,999999)}"
+    offer_id = new_offer_id()
     offer = {
         "offer_id": offer_id,
         "driver_id": driver_id,
         "created_at": time.time(),
-        "ttl_seconds": 25,
+        "ttl_seconds": OFFER_TTL_S,
         "status": "pending",
         "candidate": candidate.model_dump(),
         "rating": rating.model_dump(),
         "actuals": None,
     }
-    _OFFERS[offer_id] = offer
-    return offer
-
-def _db():
-    return sqlite3.connect("db/uber_hackathon_v2.db")
+    # shared (sqlite) store writes a row: keep that off the event loop
+    return OFFERS.put(offer) if OFFERS.in_memory else await run_db(OFFERS.put, offer)
 
 @router.post("/drivers/{driver_id}/complete")
 def driver_complete(driver_id: str, body: CompleteIn):
     """
-    Mark an accepted offer as completed and bump today's live aggregates in DB.
+    Mark an accepted offer as completed and bump today's live aggregates.
+    The live store updates its record at once and writes live_aggregates in
+    the next batch (state/write_behind.py).
     """
-    day = date.today().isoformat()
-    conn = _db()
-    try:
-        conn.execute("""
-            INSERT INTO live_aggregates (day, earner_id, earn_eur, minutes, rides)
-            VALUES (?, ?, ?, ?, 1)
-            ON CONFLICT(day, earner_id) DO UPDATE SET
-                earn_eur = earn_eur + excluded.earn_eur,
-                minutes  = minutes  + excluded.minutes,
-                rides    = rides    + 1;
-        """, (day, driver_id, float(body.net_eur or 0), float(body.duration_mins or 0)))
-        conn.commit()
-    finally:
-        conn.close()
+    LIVE.record_completion(driver_id, body.net_eur, body.duration_mins)
+    publish(driver_topic(driver_id), {"type": "complete", "offer_id": body.offer_id})
     return {"ok": True, "offer_id": getattr(body, 'offer_id', None), "status": "completed"}
 
 @router.get("/drivers/{driver_id}/today_live")
 def today_live(driver_id: str):
     """
-    Read today's live aggregates from DB (persistent).
+    Read today's live aggregates (persistent table + not yet flushed completions).
     """
-    day = date.today().isoformat()
-    conn = _db()
-    try:
-        row = conn.execute("""
-            SELECT earn_eur, minutes, rides
-            FROM live_aggregates
-            WHERE day = ? AND earner_id = ?;
-        """, (day, driver_id)).fetchone()
-    finally:
-        conn.close()
-    if not row:
-        return {"earn_eur": 0.0, "minutes": 0.0, "rides": 0}
-    return {
-        "earn_eur": float(row[0] or 0.0),
-        "minutes": float(row[1] or 0.0),
-        "rides": int(row[2] or 0),
-    }
+    rec = LIVE.today(driver_id)
+    return {"earn_eur": rec.earn_eur, "minutes": rec.minutes, "rides": rec.rides}
+
+@router.get("/live/stats")
+def live_stats():
+    """Live store cache + write-behind buffer counters."""
+    return LIVE.snapshot()
+
+@router.get("/offers/stats")
+def offer_stats():
+    """Live (pending) / expired / evicted counters of the offer store."""
+    return OFFERS.snapshot()
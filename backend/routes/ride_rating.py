@@ -1,13 +1,42 @@
 from fastapi import APIRouter, Query
 from ..rating.models import RideCandidate, RideRating
-from ..rating.service import rate_ride
+from ..rating.service import rate_ride_async, rate_rides
+from ..rating import anchors
+from ..rating.traffic import traffic_cache_stats
 
 router = APIRouter(prefix="/rides", tags=["rides"])
 
 @router.post("/rate", response_model=RideRating)
-def rate(candidate: RideCandidate, debug: bool = Query(False)):
+async def rate(candidate: RideCandidate, debug: bool = Query(False)):
     """
     Rate a single incoming ride request for the driver popup.
     Use ?debug=true to include anchors_used for calibration.
+    Traffic is bounded by TRAFFIC_DEADLINE_S (neutral 70 when exceeded).
     """
-    return rate_ride(candidate, debug=debug)
+    return await rate_ride_async(candidate, debug=debug)
+
+@router.post("/rate_batch", response_model=list[RideRating])
+def rate_batch(candidates: list[RideCandidate], debug: bool = Query(False),
+               reasons: bool = Query(True)):
+    """
+    Rate many candidates (possibly across cities) in one vectorized pass.
+    Ratings are returned in the same order as the request body.
+    Use ?reasons=false to skip formatting the per-factor reason strings.
+    """
+    return rate_rides(candidates, debug=debug, with_reasons=reasons)
+
+@router.get("/anchors/stats")
+def anchor_stats():
+    """Hit/miss counters and cached cities of the per-city anchor cache."""
+    return anchors.stats()
+
+@router.post("/anchors/invalidate")
+def anchor_invalidate(city_id: int | None = None):
+    """Drop cached anchors for one city (or all) after reloading data."""
+    anchors.invalidate(city_id)
+    return {"ok": True, "city_id": city_id}
+
+@router.get("/traffic/stats")
+def traffic_stats():
+    """Hit/miss/coalesced counters of the traffic result cache."""
+    return traffic_cache_stats()
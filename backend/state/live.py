@@ -0,0 +1,214 @@
+# backend/state/live.py
+# The one place live (today) driver state lives.
+#
+# Every accept/complete goes through LIVE: it updates the driver's cached
+# record and queues the same delta for live_aggregates (write-behind, see
+# write_behind.py), so SQLite always has the full record and the in-memory
+# side is only a bounded cache of it:
+#   - at most LIVE_CACHE_DRIVERS records, least recently used evicted first
+#   - everything is dropped when the local day rolls over
+# A miss (evicted driver, restart) reloads from live_aggregates plus any
+# still-buffered delta. Every today* endpoint reads through today().
+#
+# With STATE_BACKEND=sqlite (several workers) a per-process cache would go
+# stale as soon as another worker records something, so SharedLiveStore
+# writes each delta straight to live_aggregates and reads the row back.
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from ..db import STATE_BACKEND, connection, execute, run_db
+from .write_behind import FIELDS, LIVE_AGGREGATES, UPSERT_SQL
+
+LIVE_CACHE_DRIVERS = int(os.getenv("LIVE_CACHE_DRIVERS", "10000"))
+
+
+class DriverDay:
+    """Live counters for one driver on one day (same fields as live_aggregates)."""
+
+    __slots__ = ("earner_id", "day") + FIELDS
+
+    def __init__(self, earner_id: str, day: str, values=None):
+        self.earner_id = earner_id
+        self.day = day
+        for f, v in zip(FIELDS, values or (0.0, 0.0, 0, 0, 0.0, 0.0)):
+            setattr(self, f, v)
+
+    def _apply(self, delta):
+        for f, v in zip(FIELDS, delta):
+            setattr(self, f, getattr(self, f) + v)
+
+    @property
+    def avg_rating(self) -> float:
+        """Mean rider rating over today's accepted offers."""
+        return round(self.ratings_sum / self.accepted, 2) if self.accepted > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {f: getattr(self, f) for f in FIELDS}
+
+
+class LiveStore:
+    def __init__(self, max_drivers: int = LIVE_CACHE_DRIVERS):
+        self.max_drivers = max_drivers
+        self._lock = threading.Lock()
+        self._records = OrderedDict()  # { earner_id: DriverDay } for self._day, LRU order
+        self._loading = {}             # { earner_id: Event } for misses being read from the DB
+        self._day = None
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "rollovers": 0}
+
+    def _roll(self, day: str):
+        if day != self._day:
+            if self._day is not None:
+                self.stats["rollovers"] += 1
+            self._records.clear()
+            self._day = day
+
+    def _load(self, earner_id: str, day: str) -> DriverDay:
+        def _row():
+            with connection() as conn:
+                return conn.execute(
+                    f"SELECT {', '.join(FIELDS)} FROM live_aggregates WHERE day = ? AND earner_id = ?;",
+                    (day, earner_id),
+                ).fetchone()
+
+        row, pending = LIVE_AGGREGATES.read(earner_id, _row, day)
+        rec = DriverDay(earner_id, day, tuple(row) if row is not None else None)
+        rec._apply(pending)
+        return rec
+
+    def _acquire(self, earner_id: str, day: str) -> DriverDay:
+        """
+        Take self._lock and return the driver's cached record for day; the
+        caller releases the lock. A miss reads live_aggregates with the lock
+        released (that read can wait on a write-behind flush), and concurrent
+        misses on the same driver wait for that one load. Nothing can apply a
+        delta to a driver while it is loading, so the loaded row plus pending
+        delta is exact when it goes into the cache.
+        """
+        while True:
+            self._lock.acquire()
+            self._roll(day)
+            rec = self._records.get(earner_id)
+            if rec is not None:
+                self.stats["hits"] += 1
+                self._records.move_to_end(earner_id)
+                return rec
+            loading = self._loading.get(earner_id)
+            if loading is None:
+                loading = self._loading[earner_id] = threading.Event()
+                self._lock.release()
+                break
+            self._lock.release()
+            loading.wait()
+
+        try:
+            rec = self._load(earner_id, day)
+        except BaseException:
+            with self._lock:
+                del self._loading[earner_id]
+            loading.set()
+            raise
+        self._lock.acquire()
+        del self._loading[earner_id]
+        loading.set()  # waiters retry once we release the lock, and hit
+        self._roll(day)
+        self.stats["loads"] += 1
+        self._records[earner_id] = rec
+        while len(self._records) > self.max_drivers:
+            self._records.popitem(last=False)
+            self.stats["evictions"] += 1
+        return rec
+
+    def cached(self, earner_id: str):
+        """Today's record if it is in memory, else None. Never touches the DB or
+        waits for the lock: it runs on the event loop, and a busy lock just
+        sends the caller to run_db like a miss."""
+        day = date.today().isoformat()
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if day != self._day:
+                return None
+            rec = self._records.get(earner_id)
+            if rec is not None:
+                self.stats["hits"] += 1
+                self._records.move_to_end(earner_id)
+            return rec
+        finally:
+            self._lock.release()
+
+    async def today_async(self, earner_id: str) -> DriverDay:
+        rec = self.cached(earner_id)
+        return rec if rec is not None else await run_db(self.today, earner_id)
+
+    def today(self, earner_id: str) -> DriverDay:
+        """Today's live record for a driver (zeros if nothing happened yet)."""
+        rec = self._acquire(earner_id, date.today().isoformat())
+        self._lock.release()
+        return rec
+
+    def _add(self, earner_id: str, delta):
+        day = date.today().isoformat()
+        rec = self._acquire(earner_id, day)
+        try:  # cache and buffer change together, so a reload never double counts
+            rec._apply(delta)
+            LIVE_AGGREGATES.add(earner_id, delta, day)
+        finally:
+            self._lock.release()
+
+    def record_accept(self, earner_id: str, est_earning: float, rider_rating: float):
+        self._add(earner_id, (0.0, 0.0, 0, 1, float(est_earning or 0), float(rider_rating or 0)))
+
+    def record_completion(self, earner_id: str, net_eur: float, minutes: float):
+        self._add(earner_id, (float(net_eur or 0), float(minutes or 0), 1, 0, 0.0, 0.0))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "day": self._day, "drivers": len(self._records),
+                    "max_drivers": self.max_drivers, "buffer": LIVE_AGGREGATES.snapshot()}
+
+
+class SharedLiveStore:
+    """LiveStore interface without the cache: live_aggregates is the only copy.
+
+    Each accept/complete is one UPSERT + commit. In WAL mode with
+    synchronous=NORMAL that is an append to the WAL, not an fsync, so the
+    write-behind buffer isn't needed to keep it cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"reads": 0, "writes": 0}
+
+    def cached(self, earner_id: str):
+        return None  # nothing is cached; callers go to the DB executor
+
+    async def today_async(self, earner_id: str) -> DriverDay:
+        return await run_db(self.today, earner_id)
+
+    def today(self, earner_id: str) -> DriverDay:
+        day = date.today().isoformat()
+        with connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM live_aggregates WHERE day = ? AND earner_id = ?;",
+                (day, earner_id),
+            ).fetchone()
+        with self._lock:
+            self.stats["reads"] += 1
+        return DriverDay(earner_id, day, tuple(row) if row is not None else None)
+
+    def _add(self, earner_id: str, delta):
+        execute(UPSERT_SQL, (date.today().isoformat(), earner_id, *delta))
+        with self._lock:
+            self.stats["writes"] += 1
+
+    record_accept = LiveStore.record_accept
+    record_completion = LiveStore.record_completion
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "day": date.today().isoformat(), "backend": "sqlite"}
+
+
+LIVE = SharedLiveStore() if STATE_BACKEND == "sqlite" else LiveStore()
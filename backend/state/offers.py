@@ -0,0 +1,230 @@
+# backend/state/offers.py
+# Offers handed out by /flow/drivers/{id}/next, with expiry.
+#
+# Every offer gets a deadline (created_at + ttl_seconds) on a min-heap. There
+# is no timer thread: each put/get first pops whatever is due, turning pending
+# offers into "expired". Decided/expired offers are kept OFFER_RETAIN_S more
+# seconds in a FIFO (so a late decision still gets its status back) and then
+# dropped. At OFFER_CAPACITY the oldest retained offers are evicted first;
+# pending offers a driver can still accept go only when nothing else is left,
+# so memory stays bounded however fast offers arrive.
+#
+# With STATE_BACKEND=sqlite the same interface is served from the `offers`
+# table instead (SqliteOfferStore), so an offer made by one worker can be
+# decided by any other.
+import heapq
+import itertools
+from collections import deque
+import json
+import os
+import secrets
+import threading
+import time
+
+from ..db import STATE_BACKEND, connection
+
+OFFER_TTL_S = 25
+OFFER_RETAIN_S = float(os.getenv("OFFER_RETAIN_S", "300"))
+OFFER_CAPACITY = int(os.getenv("OFFER_CAPACITY", "50000"))
+
+# per-process prefix + counter: unique within the process by construction and
+# across processes/restarts by the random prefix
+_PREFIX = secrets.token_hex(4)
+_SEQ = itertools.count(1)
+
+
+def new_offer_id() -> str:
+    return f"offer_{_PREFIX}-{next(_SEQ):x}"
+
+
+class OfferStore:
+    in_memory = True  # put/get/resolve never block on I/O
+
+    def __init__(self, capacity: int = OFFER_CAPACITY, retain_s: float = OFFER_RETAIN_S):
+        self.capacity = capacity
+        self.retain_s = retain_s
+        self._offers = {}  # { offer_id: offer dict }
+        self._heap = []    # (expires_at, seq, offer_id) of pending offers
+        self._retained = deque()  # (drop_at, offer_id) of decided/expired offers, drop_at ascending
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.stats = {"created": 0, "expired": 0, "decided": 0, "dropped": 0, "evicted": 0}
+
+    def _retain(self, offer_id: str, now: float):
+        # retain_s is fixed and `now` only grows, so appending keeps the deque sorted
+        self._retained.append((now + self.retain_s, offer_id))
+
+    def _sweep(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, offer_id = heapq.heappop(heap)
+            offer = self._offers.get(offer_id)
+            if offer is None or offer["status"] != "pending":
+                continue  # decided in time (already retained) or evicted
+            offer["status"] = "expired"
+            self._pending -= 1
+            self.stats["expired"] += 1
+            self._retain(offer_id, now)
+        retained = self._retained
+        while retained and retained[0][0] <= now:
+            _, offer_id = retained.popleft()
+            if self._offers.pop(offer_id, None) is not None:
+                self.stats["dropped"] += 1
+
+    def _evict_one(self) -> bool:
+        """Make room: the oldest retained (dead) offer first; a pending offer,
+        the one expiring soonest, only if nothing is retained."""
+        while self._retained:
+            _, offer_id = self._retained.popleft()
+            if self._offers.pop(offer_id, None) is not None:
+                self.stats["evicted"] += 1
+                return True
+        while self._heap:
+            _, _, offer_id = heapq.heappop(self._heap)
+            offer = self._offers.get(offer_id)
+            if offer is not None and offer["status"] == "pending":
+                del self._offers[offer_id]
+                self._pending -= 1
+                self.stats["evicted"] += 1
+                return True
+        return False
+
+    def put(self, offer: dict) -> dict:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            while len(self._offers) >= self.capacity and self._evict_one():
+                pass
+            self._offers[offer["offer_id"]] = offer
+            heapq.heappush(self._heap, (offer["created_at"] + offer["ttl_seconds"], next(self._seq), offer["offer_id"]))
+            self._pending += 1
+            self.stats["created"] += 1
+        return offer
+
+    def get(self, offer_id: str):
+        with self._lock:
+            self._sweep(time.time())
+            return self._offers.get(offer_id)
+
+    def resolve(self, offer: dict, status: str) -> bool:
+        """pending -> status (accepted/declined); False if it already left pending."""
+        with self._lock:
+            if offer["status"] != "pending" or offer["offer_id"] not in self._offers:
+                return False
+            offer["status"] = status
+            self._pending -= 1
+            self.stats["decided"] += 1
+            self._retain(offer["offer_id"], time.time())  # its heap entry is skipped when it comes due
+            return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._sweep(time.time())
+            return {**self.stats, "live": self._pending, "stored": len(self._offers),
+                    "capacity": self.capacity, "retain_s": self.retain_s}
+
+
+class SqliteOfferStore:
+    """OfferStore on the shared `offers` table (several workers, one DB).
+
+    Expiry needs no sweep to be correct: a row is live only while
+    expires_at > now, and resolve() is a single conditional UPDATE, so two
+    workers racing on the same offer can't both win. The periodic sweep just
+    marks expired rows and deletes what is past retention / over capacity.
+    """
+
+    in_memory = False
+    SWEEP_EVERY_S = 5.0
+
+    def __init__(self, capacity: int = OFFER_CAPACITY, retain_s: float = OFFER_RETAIN_S):
+        self.capacity = capacity
+        self.retain_s = retain_s
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.stats = {"created": 0, "expired": 0, "decided": 0, "dropped": 0, "evicted": 0}  # this worker's share
+
+    def _sweep(self, conn, now: float):
+        with self._lock:
+            if now - self._last_sweep < self.SWEEP_EVERY_S:
+                return
+            self._last_sweep = now
+        expired = conn.execute(
+            "UPDATE offers SET status = 'expired', decided_at = expires_at WHERE status = 'pending' AND expires_at <= ?;",
+            (now,),
+        ).rowcount
+        dropped = conn.execute(
+            "DELETE FROM offers WHERE status != 'pending' AND decided_at <= ?;", (now - self.retain_s,)
+        ).rowcount
+        over = conn.execute("SELECT COUNT(*) FROM offers;").fetchone()[0] - self.capacity
+        evicted = 0
+        if over > 0:  # decided/expired rows first (oldest first), pending ones last
+            evicted = conn.execute(
+                """DELETE FROM offers WHERE offer_id IN (
+                       SELECT offer_id FROM offers
+                       ORDER BY status = 'pending', COALESCE(decided_at, expires_at) LIMIT ?);""",
+                (over,),
+            ).rowcount
+        with self._lock:
+            self.stats["expired"] += expired
+            self.stats["dropped"] += dropped
+            self.stats["evicted"] += evicted
+
+    def put(self, offer: dict) -> dict:
+        now = time.time()
+        with connection() as conn:
+            self._sweep(conn, now)
+            conn.execute(
+                "INSERT INTO offers (offer_id, driver_id, created_at, expires_at, status, body) VALUES (?, ?, ?, ?, ?, ?);",
+                (offer["offer_id"], offer["driver_id"], offer["created_at"],
+                 offer["created_at"] + offer["ttl_seconds"], offer["status"], json.dumps(offer)),
+            )
+            conn.commit()
+        with self._lock:
+            self.stats["created"] += 1
+        return offer
+
+    def get(self, offer_id: str):
+        with connection() as conn:
+            row = conn.execute(
+                "SELECT status, expires_at, body FROM offers WHERE offer_id = ?;", (offer_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        offer = json.loads(row["body"])
+        status = row["status"]
+        if status == "pending" and row["expires_at"] <= time.time():
+            status = "expired"  # the next sweep writes it down
+        offer["status"] = status
+        return offer
+
+    def resolve(self, offer: dict, status: str) -> bool:
+        """pending -> status (accepted/declined); False if it already left pending."""
+        now = time.time()
+        with connection() as conn:
+            won = conn.execute(
+                "UPDATE offers SET status = ?, decided_at = ? WHERE offer_id = ? AND status = 'pending' AND expires_at > ?;",
+                (status, now, offer["offer_id"], now),
+            ).rowcount == 1
+            conn.commit()
+        if not won:
+            current = self.get(offer["offer_id"])
+            offer["status"] = current["status"] if current is not None else "expired"
+            return False
+        offer["status"] = status
+        with self._lock:
+            self.stats["decided"] += 1
+        return True
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with connection() as conn:
+            live, stored = conn.execute(
+                "SELECT COALESCE(SUM(status = 'pending' AND expires_at > ?), 0), COUNT(*) FROM offers;", (now,)
+            ).fetchone()
+        with self._lock:
+            return {**self.stats, "live": live, "stored": stored, "capacity": self.capacity,
+                    "retain_s": self.retain_s, "backend": "sqlite"}
+
+
+OFFERS = SqliteOfferStore() if STATE_BACKEND == "sqlite" else OfferStore()
@@ -0,0 +1,192 @@
+# backend/state/pubsub.py
+# Tiny pub/sub used to push live driver stats to open SSE streams.
+#
+# Handlers that mutate a driver's numbers (flow complete/decision) call
+# publish(driver_topic(id), event); every open /earners/{id}/stream for that
+# driver wakes up. Publishers are plain sync handlers running in the
+# threadpool, so delivery hops onto the subscriber's event loop with
+# call_soon_threadsafe.
+#
+# The broker is swappable: anything with the same publish/subscribe/
+# unsubscribe shape can be installed with set_broker(). With
+# STATE_BACKEND=sqlite the default is SqliteBroker, which relays events
+# between workers through the live_events table.
+import asyncio
+import json
+import os
+import threading
+import time
+
+from ..db import STATE_BACKEND, connection, execute
+
+SUBSCRIBER_QUEUE_SIZE = 16
+PUBSUB_POLL_S = float(os.getenv("PUBSUB_POLL_S", "0.25"))
+PUBSUB_RETAIN_S = 60.0
+
+
+def driver_topic(driver_id: str) -> str:
+    return f"driver:{driver_id}"
+
+
+class Subscription:
+    """One stream's inbox. Full queues drop the oldest event: consumers only
+    need to know "something changed", the newest event wins."""
+
+    __slots__ = ("topic", "queue", "loop")
+
+    def __init__(self, topic: str, loop: asyncio.AbstractEventLoop):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _deliver(self, event):  # runs on self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float | None = None):
+        """Next event, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self) -> list:
+        out = []
+        while not self.queue.empty():
+            out.append(self.queue.get_nowait())
+        return out
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}  # { topic: set(Subscription) }
+        self.published = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Call from the event loop that will consume the events."""
+        sub = Subscription(topic, asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subs.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.topic]
+
+    def publish(self, topic: str, event) -> int:
+        """Thread-safe; returns how many subscribers the event was queued for."""
+        with self._lock:
+            subs = list(self._subs.get(topic, ()))
+            self.published += 1
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, event)
+            except RuntimeError:  # subscriber's loop already closed
+                self.unsubscribe(sub)
+        return len(subs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "topics": len(self._subs),
+                "subscribers": sum(len(s) for s in self._subs.values()),
+                "published": self.published,
+            }
+
+
+class SqliteBroker:
+    """Cross-worker broker: publish() appends to live_events, and one poller
+    thread per worker tails the table and fans new rows out to this worker's
+    subscribers (through an InProcessBroker). The poller runs only while the
+    worker has subscribers, and costs one indexed query per PUBSUB_POLL_S no
+    matter how many streams are open."""
+
+    def __init__(self, poll_s: float = PUBSUB_POLL_S, retain_s: float = PUBSUB_RETAIN_S):
+        self.poll_s = poll_s
+        self.retain_s = retain_s
+        self._local = InProcessBroker()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_id = 0
+        self.published = 0
+        self.relayed = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        sub = self._local.subscribe(topic)
+        self._ensure_poller()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._local.unsubscribe(sub)
+
+    def publish(self, topic: str, event) -> int:
+        """Queued for every worker's subscribers; returns 1 (delivery count is per worker)."""
+        execute(
+            "INSERT INTO live_events (topic, payload, created_at) VALUES (?, ?, ?);",
+            (topic, json.dumps(event, separators=(",", ":")), time.time()),
+        )
+        with self._lock:
+            self.published += 1
+        return 1
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            with connection() as conn:  # only events published from now on
+                self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM live_events;").fetchone()[0]
+            self._thread = threading.Thread(target=self._run, name="pubsub-poll", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        last_prune = 0.0
+        while True:
+            with self._lock:  # same lock as _ensure_poller: a new subscriber either sees us or restarts us
+                if not self._local.stats()["subscribers"]:
+                    self._thread = None
+                    return
+            time.sleep(self.poll_s)
+            try:
+                with connection() as conn:
+                    rows = conn.execute(
+                        "SELECT id, topic, payload FROM live_events WHERE id > ? ORDER BY id;", (self._last_id,)
+                    ).fetchall()
+                    now = time.time()
+                    if now - last_prune > self.retain_s:
+                        last_prune = now
+                        conn.execute("DELETE FROM live_events WHERE created_at < ?;", (now - self.retain_s,))
+                        conn.commit()
+            except Exception:
+                continue  # busy/locked: pick the rows up next round
+            for row in rows:
+                self._last_id = row["id"]
+                self._local.publish(row["topic"], json.loads(row["payload"]))
+            self.relayed += len(rows)
+
+    def stats(self) -> dict:
+        return {**self._local.stats(), "published": self.published, "relayed": self.relayed,
+                "backend": "sqlite"}
+
+
+_BROKER = SqliteBroker() if STATE_BACKEND == "sqlite" else InProcessBroker()
+
+
+def get_broker():
+    return _BROKER
+
+
+def set_broker(broker):
+    """Install another broker implementation (same method names)."""
+    global _BROKER
+    _BROKER = broker
+    return broker
+
+
+def publish(topic: str, event) -> int:
+    return _BROKER.publish(topic, event)
@@ -0,0 +1,132 @@
+# backend/state/write_behind.py
+# Write-behind buffer for live_aggregates.
+#
+# The live store (state/live.py) adds each accept/complete delta to an
+# in-memory dict keyed by (day, earner_id); a background thread folds
+# everything accumulated into live_aggregates with one executemany + one
+# commit every LIVE_FLUSH_INTERVAL_S seconds, or as soon as LIVE_FLUSH_BATCH
+# updates are waiting. So N completions cost one fsync instead of N.
+#
+# Reads must see unflushed deltas: read() runs the caller's DB read and picks
+# up the pending delta under the flush lock, so a batch is counted either in
+# the table or in the buffer, never both and never neither. Adds don't take
+# the flush lock, so writers never wait on a commit.
+import os
+import threading
+from datetime import date
+
+from ..db import connection
+
+LIVE_FLUSH_INTERVAL_S = float(os.getenv("LIVE_FLUSH_INTERVAL_S", "1.0"))
+LIVE_FLUSH_BATCH = int(os.getenv("LIVE_FLUSH_BATCH", "500"))
+
+# live_aggregates counters, in delta order
+FIELDS = ("earn_eur", "minutes", "rides", "accepted", "accepted_earn", "ratings_sum")
+ZERO = (0.0, 0.0, 0, 0, 0.0, 0.0)
+
+UPSERT_SQL = f"""
+    INSERT INTO live_aggregates (day, earner_id, {", ".join(FIELDS)})
+    VALUES (?, ?, {", ".join("?" for _ in FIELDS)})
+    ON CONFLICT(day, earner_id) DO UPDATE SET
+        {", ".join(f"{f} = {f} + excluded.{f}" for f in FIELDS)};
+"""
+
+
+class WriteBehindAggregator:
+    def __init__(self, interval_s: float = LIVE_FLUSH_INTERVAL_S, batch: int = LIVE_FLUSH_BATCH):
+        self.interval_s = interval_s
+        self.batch = batch
+        self._pending = {}  # { (day, earner_id): [delta per FIELDS] }
+        self._count = 0     # adds waiting
+        self._lock = threading.Lock()        # guards _pending
+        self._flush_lock = threading.Lock()  # one flush at a time; reads see a consistent split
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"added": 0, "flushes": 0, "rows_written": 0, "errors": 0}
+
+    def add(self, earner_id: str, delta, day: str | None = None):
+        """delta: one value per FIELDS."""
+        key = (day or date.today().isoformat(), earner_id)
+        with self._lock:
+            acc = self._pending.get(key)
+            if acc is None:
+                acc = self._pending[key] = list(ZERO)
+            for i, v in enumerate(delta):
+                acc[i] += v
+            self._count += 1
+            self.stats["added"] += 1
+            full = self._count >= self.batch
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def pending(self, earner_id: str, day: str | None = None) -> tuple:
+        """Unflushed delta (per FIELDS) for one earner/day."""
+        with self._lock:
+            acc = self._pending.get((day or date.today().isoformat(), earner_id))
+            return tuple(acc) if acc is not None else ZERO
+
+    def read(self, earner_id: str, read_db, day: str | None = None):
+        """(read_db(), pending delta) taken consistently w.r.t. concurrent flushes."""
+        with self._flush_lock:
+            return read_db(), self.pending(earner_id, day)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._count = self._pending, {}, 0
+            if not batch:
+                return 0
+            rows = [(d, e, *acc) for (d, e), acc in batch.items()]
+            try:
+                with connection() as conn:
+                    conn.executemany(UPSERT_SQL, rows)
+                    conn.commit()
+            except Exception:
+                self.stats["errors"] += 1
+                with self._lock:  # keep the deltas for the next attempt
+                    for key, acc in batch.items():
+                        cur = self._pending.setdefault(key, list(ZERO))
+                        for i, v in enumerate(acc):
+                            cur[i] += v
+                        self._count += 1
+                raise
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(rows)
+            return len(rows)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="live-aggregates-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # counted in stats; retried next round
+
+    def stop(self):
+        """Stop the flusher and write out whatever is still buffered (API shutdown)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        return self.flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "pending_keys": len(self._pending), "pending_updates": self._count,
+                    "interval_s": self.interval_s, "batch": self.batch}
+
+
+LIVE_AGGREGATES = WriteBehindAggregator()
+
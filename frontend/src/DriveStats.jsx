@@ -53,40 +53,30 @@ const earningsPerHour =
     : null;
 
 
+  // Live stats are pushed by the server (snapshot on connect + on every
+  // complete/decision); EventSource reconnects by itself after a drop.
   useEffect(() => {
-    let alive = true;
-    async function fetchSummary() {
-      try {
-        const res = await fetch(`http://localhost:8000/earners/${earnerId}/today_summary`);
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const data = await res.json();
-        if (!alive) return;
-        setSummary(data);
-      } catch (e) {
-        setError(e.message || "Failed to fetch");
-      } finally {
-        setLoading(false);
-      }
-    }
-    fetchSummary();
-    const id = setInterval(fetchSummary, 20000);
-    return () => { alive = false; clearInterval(id); };
+    const es = api.earnerStream(earnerId);
+    es.addEventListener("stats", (e) => {
+      setSummary(JSON.parse(e.data));
+      setError(null);
+      setLoading(false);
+    });
+    es.onerror = () => {
+      if (es.readyState === EventSource.CLOSED) setError("Live updates disconnected");
+    };
+    return () => es.close();
   }, [earnerId]);
 
   // Listen for rideCompleted event to instantly refresh dashboard
   useEffect(() => {
     function handleRideCompleted() {
-      // Optimistic update
+      // Optimistic update; the stream pushes the real numbers right after
       setSummary(prev => prev ? {
         ...prev,
         today_earnings: (prev.today_earnings ?? 0) + 5,
         rides_completed: (prev.rides_completed ?? 0) + 1
       } : prev);
-      // Fetch real data
-      fetch(`http://localhost:8000/earners/${earnerId}/today_summary`)
-        .then(r => r.json())
-        .then(setSummary)
-        .catch(console.error);
     }
     window.addEventListener("rideCompleted", handleRideCompleted);
     return () => window.removeEventListener("rideCompleted", handleRideCompleted);
@@ -2,19 +2,9 @@
 import { useEffect, useMemo, useRef, useState } from "react";
 import L from "leaflet";
 import "leaflet/dist/leaflet.css";
-import { heatmapPredict } from "./api";
+import { heatmapTimeline } from "./api";
 
 // ---------- time helpers ----------
-function toISOWithTZ(d) {
-  const tzMin = -d.getTimezoneOffset();
-  const sign = tzMin >= 0 ? "+" : "-";
-  const pad = (n) => String(Math.floor(Math.abs(n))).padStart(2, "0");
-  const hh = pad(tzMin / 60);
-  const mm = pad(tzMin % 60);
-  return new Date(d.getTime() - d.getTimezoneOffset() * 60000)
-    .toISOString()
-    .replace("Z", `${sign}${hh}:${mm}`);
-}
 const roundToHalfHour = (d) => {
   const x = new Date(d);
   const m = x.getMinutes();
@@ -29,6 +19,20 @@ const addMinutes = (d, m) => {
 const formatSlotLabel = (d) =>
   d.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" });
 
+// the backend model is keyed by Amsterdam local date + hour
+const AMS_PARTS = new Intl.DateTimeFormat("en-CA", {
+  timeZone: "Europe/Amsterdam",
+  year: "numeric",
+  month: "2-digit",
+  day: "2-digit",
+  hour: "2-digit",
+  hourCycle: "h23",
+});
+function amsDayHour(d) {
+  const p = Object.fromEntries(AMS_PARTS.formatToParts(d).map((x) => [x.type, x.value]));
+  return { day: `${p.year}-${p.month}-${p.day}`, hour: parseInt(p.hour, 10) };
+}
+
 // --- palette (Uber-ish) ---
 function colorFor(v /* 0..1 */) {
   const colors = ["#7ED957", "#F7E463", "#F9B44C", "#F47C3C", "#E53935"];
@@ -174,16 +178,26 @@ export default function HeatmapTimeline({
   }
 
   // -------- fetch & cache --------
-  async function loadSlot(d) {
-    const tKey = d.toISOString().slice(0, 16);
+  // One /heatmap/timeline call per local day covers every slot of that day;
+  // the promise is cached so the prefetch and the current slot share it.
+  function loadDay(day) {
     const locKey = `${lat.toFixed(4)},${lng.toFixed(4)}`;
-    const key = `${tKey}|${locKey}|${radiusKm}|${weight}`;
+    const key = `${day}|${locKey}|${radiusKm}|${weight}`;
     if (cacheRef.current.has(key)) return cacheRef.current.get(key);
 
-    const whenISO = toISOWithTZ(d);
-    const data = await heatmapPredict({ lat, lng, radiusKm, whenISO, weight, mode: "grid" });
-    cacheRef.current.set(key, data);
-    return data;
+    const p = heatmapTimeline({ lat, lng, day, radiusKm, weight });
+    p.catch(() => cacheRef.current.delete(key));
+    cacheRef.current.set(key, p);
+    return p;
+  }
+
+  async function loadSlot(d) {
+    const { day, hour } = amsDayHour(d);
+    const tl = await loadDay(day);
+    const col = tl.hours.indexOf(hour);
+    return {
+      cells: tl.cells.map((c, i) => ({ ...c, value: col < 0 ? 0 : tl.values[i][col] })),
+    };
   }
 
   // -------- slideshow --------
@@ -53,6 +53,16 @@ export const api = {
   earnerTodayTime: (earnerId) =>
     get(`/earners/${encodeURIComponent(earnerId)}/today_time`),
 
+  // today's totals + live overlay + incentives in one call. The response is
+  // ETag'd with Cache-Control: no-cache, so the browser revalidates with
+  // If-None-Match and unchanged polls come back as a bodiless 304.
+  earnerDashboard: (earnerId) =>
+    get(`/earners/${encodeURIComponent(earnerId)}/dashboard`),
+
+  // SSE: a "stats" event (same body as earnerDashboard) on connect and on every change
+  earnerStream: (earnerId) =>
+    new EventSource(`${API}/earners/${encodeURIComponent(earnerId)}/stream`),
+
   // === Wellness & Nudges ===
   getNudges: () => get(`/nudges`),
 
@@ -105,3 +115,18 @@ export async function heatmapPredict({ lat, lng, whenISO, radiusKm = 3, weight =
   return res.json();
 }
 
+
+// One call per local (Europe/Amsterdam) day: cell geometry once + values[cell][slot]
+export async function heatmapTimeline({ lat, lng, day, hours = null, radiusKm = 3, weight = "count" }) {
+  const q = new URLSearchParams({
+    lat: String(lat),
+    lng: String(lng),
+    day,
+    radius_km: String(radiusKm),
+    weight,
+  });
+  if (hours) hours.forEach((h) => q.append("hours", String(h)));
+  const res = await fetch(`${API}/heatmap/timeline?${q.toString()}`);
+  if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+  return res.json();
+}
@@ -1,9 +1,14 @@
 import sqlite3
+import sys
 from pathlib import Path
 import pandas as pd
 import h3
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.heatmap.store import SMOOTHED_PATH, build_smoothed, load_raw, write_smoothed
+
 DB = Path("db/uber_hackathon_v2.db")
+AGG_STAMP = DB.parent / "agg_h3_dow_hr.stamp"  # watched by backend/heatmap/store.py
 H3_RES = 8
 
 # prefer full timestamps that include hours
@@ -82,7 +87,16 @@ def main():
     print(f"[aggregate_trips] hours: {by_hour}")
     print(f"[aggregate_trips] dows : {by_dow}")
 
+    # precompute the hour/neighbour-smoothed layer the API serves
+    index, tensor = load_raw(conn)
+    cells, layer = build_smoothed(index, tensor)
+    write_smoothed(cells, layer)
+    print(f"[aggregate_trips] smoothed layer: {len(cells)} cells -> {SMOOTHED_PATH}")
+
     conn.close()
+
+    # tell a running API to reload its in-memory copy of agg_h3_dow_hr
+    AGG_STAMP.touch()
     print("[aggregate_trips] Done.")
 
 if __name__ == "__main__":
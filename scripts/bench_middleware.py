@@ -0,0 +1,86 @@
+"""
+Per-request middleware overhead of the API app, old assembly vs create_app().
+
+The old backend/api.py stacked CORSMiddleware once per app construction
+(twice on the app that was finally served). "before" rebuilds that by adding
+the extra CORS layers on top of create_app(); "after" is create_app() as is.
+Both serve a trivial async route driven straight through ASGI (no sockets),
+with a cross-origin Origin header so CORS actually runs.
+
+  python scripts/bench_middleware.py
+  python scripts/bench_middleware.py --requests 20000 --extra-cors 2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.middleware.cors import CORSMiddleware
+
+from backend.api import CORS_ORIGINS, create_app
+
+PATH = "/_bench/ping"
+
+
+async def _ping():
+    return {"ok": True}
+
+
+def build(extra_cors: int):
+    app = create_app()
+    app.add_api_route(PATH, _ping)
+    for _ in range(extra_cors):
+        app.add_middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_credentials=True,
+                           allow_methods=["*"], allow_headers=["*"])
+    return app
+
+
+async def _drive(app, n: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": PATH, "raw_path": PATH.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench"), (b"origin", CORS_ORIGINS[0].encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def run(args):
+    apps = {"before": build(args.extra_cors), "after": build(0)}
+    for app in apps.values():
+        await _drive(app, 500)  # warm-up; also builds the middleware stack
+    results = {name: [] for name in apps}
+    for _ in range(args.rounds):  # interleaved, so drift hits both alike
+        for name, app in apps.items():
+            results[name].append(await _drive(app, args.requests))
+    for name, runs in results.items():
+        print(f"{name:>6}: CORS layers={1 + (args.extra_cors if name == 'before' else 0)}  "
+              f"median {statistics.median(runs):7.1f} us/req  best {min(runs):7.1f} us/req")
+    saved = statistics.median(results["before"]) - statistics.median(results["after"])
+    print(f"saved  : {saved:.1f} us/req")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--rounds", type=int, default=7)
+    ap.add_argument("--extra-cors", type=int, default=1, help="layers the old assembly added on top of one")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# scripts/build_traffic_model.py
+# Offline congestion model for TRAFFIC_SOURCE=historical (backend/rating/traffic_model.py).
+#
+# For every trip in rides_trips: pace = minutes per km. The free-flow baseline
+# is a low percentile of pace per city (the speed you get on an empty road);
+# congestion ratio = median pace of a bucket / baseline. Buckets:
+#   traffic_model     (pickup res-7, drop res-7, dow, hour)  -- MIN_TRIPS or more
+#   traffic_model_hr  (pickup res-7, hour)                   -- fallback for sparse routes
+#
+#   python scripts/build_traffic_model.py
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+import h3
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.rating.traffic_model import MODEL_RES, MODEL_STAMP
+
+DB = Path("db/uber_hackathon_v2.db")
+STAMP = DB.parent / f"{MODEL_STAMP}.stamp"  # watched by backend/rating/traffic_model.py
+
+FREE_FLOW_PCT = 15     # pace percentile treated as free-flow
+MIN_TRIPS = 3          # per exact bucket
+MIN_DISTANCE_KM = 0.5  # very short trips are dominated by pickup/drop time
+PACE_RANGE = (0.4, 15.0)  # min/km; outside this is bad data (150 km/h .. 4 km/h)
+
+
+def _duration_expr(conn):
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(rides_trips)").fetchall()}
+    if "duration_min" in cols and "duration_mins" in cols:
+        return "COALESCE(duration_mins, duration_min)"
+    return "duration_min" if "duration_min" in cols else "duration_mins"
+
+
+def load_trips(conn):
+    sql = f"""
+        SELECT
+            city_id,
+            pickup_lat, pickup_lon, drop_lat, drop_lon,
+            CAST(STRFTIME('%w', datetime(start_time)) AS INT) AS dow,   -- 0=Sun..6=Sat
+            CAST(STRFTIME('%H', datetime(start_time)) AS INT) AS hour,  -- 0..23
+            distance_km,
+            {_duration_expr(conn)} AS dur
+        FROM rides_trips
+        WHERE pickup_lat IS NOT NULL AND pickup_lon IS NOT NULL
+          AND drop_lat IS NOT NULL AND drop_lon IS NOT NULL
+          AND start_time IS NOT NULL
+          AND distance_km >= ?
+    """
+    df = pd.read_sql_query(sql, conn, params=(MIN_DISTANCE_KM,))
+    df = df.dropna(subset=["dow", "hour", "dur"])
+    df["pace"] = df["dur"] / df["distance_km"]
+    df = df[df["pace"].between(*PACE_RANGE)]
+    return df
+
+
+def build(df):
+    df = df.copy()
+    df["p7"] = [h3.latlng_to_cell(a, b, MODEL_RES) for a, b in zip(df["pickup_lat"], df["pickup_lon"])]
+    df["d7"] = [h3.latlng_to_cell(a, b, MODEL_RES) for a, b in zip(df["drop_lat"], df["drop_lon"])]
+
+    # free-flow pace per city (global percentile for trips without a city)
+    global_ff = float(np.percentile(df["pace"], FREE_FLOW_PCT))
+    city_ff = df.groupby("city_id")["pace"].quantile(FREE_FLOW_PCT / 100.0)
+    df["free_flow"] = df["city_id"].map(city_ff).fillna(global_ff)
+
+    def _agg(keys):
+        g = df.groupby(keys).agg(
+            n=("pace", "size"),
+            pace=("pace", "median"),
+            free_flow=("free_flow", "median"),
+        ).reset_index()
+        g["ratio"] = (g["pace"] / g["free_flow"]).clip(lower=1.0)
+        return g
+
+    exact = _agg(["p7", "d7", "dow", "hour"])
+    exact = exact[exact["n"] >= MIN_TRIPS]
+    hourly = _agg(["p7", "hour"])
+    return exact, hourly
+
+
+def write(conn, exact, hourly):
+    conn.execute("DROP TABLE IF EXISTS traffic_model")
+    conn.execute("""
+        CREATE TABLE traffic_model(
+            p7    TEXT,
+            d7    TEXT,
+            dow   INT,   -- 0=Sun..6=Sat
+            hour  INT,   -- 0..23
+            n     INT,
+            pace  REAL,  -- median min/km
+            ratio REAL,  -- pace / free-flow pace
+            PRIMARY KEY(p7, d7, dow, hour)
+        )
+    """)
+    conn.execute("DROP TABLE IF EXISTS traffic_model_hr")
+    conn.execute("""
+        CREATE TABLE traffic_model_hr(
+            p7    TEXT,
+            hour  INT,
+            n     INT,
+            pace  REAL,
+            ratio REAL,
+            PRIMARY KEY(p7, hour)
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO traffic_model(p7, d7, dow, hour, n, pace, ratio) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(r.p7, r.d7, int(r.dow), int(r.hour), int(r.n), float(r.pace), float(r.ratio))
+         for r in exact.itertuples(index=False)],
+    )
+    conn.executemany(
+        "INSERT INTO traffic_model_hr(p7, hour, n, pace, ratio) VALUES (?, ?, ?, ?, ?)",
+        [(r.p7, int(r.hour), int(r.n), float(r.pace), float(r.ratio))
+         for r in hourly.itertuples(index=False)],
+    )
+    conn.commit()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=str(DB))
+    args = ap.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    df = load_trips(conn)
+    if df.empty:
+        raise RuntimeError("No usable trips (need pickup/drop coordinates, start_time, distance and duration).")
+    print(f"[build_traffic_model] trips used: {len(df)}")
+
+    exact, hourly = build(df)
+    write(conn, exact, hourly)
+    conn.close()
+    print(f"[build_traffic_model] traffic_model rows: {len(exact)} (>= {MIN_TRIPS} trips each)")
+    print(f"[build_traffic_model] traffic_model_hr rows: {len(hourly)}")
+    print(f"[build_traffic_model] ratio p50/p90: {exact['ratio'].median():.2f} / {exact['ratio'].quantile(0.9):.2f}"
+          if len(exact) else "[build_traffic_model] no exact buckets (too few trips per route)")
+
+    # tell a running API to reload the model
+    Path(args.db).parent.joinpath(STAMP.name).touch()
+    print("[build_traffic_model] Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,18 @@
 """
 Script to create new backend tables required for real-time driver stats aggregation.
 Run this script once to ensure your database schema is up to date.
+The table definitions live in backend/migrations.py (also applied at API startup).
 """
 
-import sqlite3
+import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parents[1] / "db" / "uber_hackathon_v2.db"
-
-CREATE_TABLES_SQL = """
-CREATE TABLE IF NOT EXISTS live_aggregates (
-    day TEXT NOT NULL,
-    earner_id TEXT NOT NULL,
-    earn_eur REAL NOT NULL DEFAULT 0,
-    minutes REAL NOT NULL DEFAULT 0,
-    rides INTEGER NOT NULL DEFAULT 0,
-    PRIMARY KEY (day, earner_id)
-);
-"""
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.migrations import migrate
 
 def main():
-    conn = sqlite3.connect(str(DB_PATH))
-    try:
-        conn.executescript(CREATE_TABLES_SQL)
-        conn.commit()
-        print("✅ Tables created/verified successfully.")
-    finally:
-        conn.close()
+    version = migrate()
+    print(f"✅ Tables created/verified successfully (schema v{version}).")
 
 if __name__ == "__main__":
     main()
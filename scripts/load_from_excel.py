@@ -12,6 +12,7 @@ geopy.geocoders.options.default_ssl_context = ssl.create_default_context(cafile=
 EXCEL = Path("data/uber_hackathon_v2_mock_data.xlsx")
 DB    = Path("db/uber_hackathon_v2.db")
 SCHEMA= Path("db/schema.sql")
+HIST_STAMP = DB.parent / "hist_data.stamp"  # watched by backend/rating/anchors.py
 
 geolocator = Nominatim(user_agent="smart-earner")
 
@@ -93,6 +94,7 @@ def main():
 
     conn.commit()
     conn.close()
+    HIST_STAMP.touch()  # running API drops its cached rating anchors
     print(f"Done. DB at {DB}")
 
 if __name__ == "__main__":
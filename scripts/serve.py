@@ -0,0 +1,38 @@
+"""
+Production launch: N uvicorn workers sharing offers / live stats / SSE events
+through SQLite (STATE_BACKEND=sqlite), so any worker can serve any request,
+e.g. /flow/drivers/{id}/decision for an offer another worker handed out.
+
+  python scripts/serve.py                 # one worker per CPU on :8000
+  python scripts/serve.py --workers 4 --port 8080
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("STATE_BACKEND", "sqlite")
+
+import uvicorn
+
+from backend.migrations import migrate
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+
+    if args.workers > 1 and os.environ["STATE_BACKEND"] != "sqlite":
+        sys.exit("STATE_BACKEND must be sqlite with more than one worker (offers would be per worker)")
+
+    # once here, so the workers' own startup migrate() finds nothing to do
+    version = migrate()
+    print(f"schema v{version}, STATE_BACKEND={os.environ['STATE_BACKEND']}, {args.workers} worker(s)")
+    uvicorn.run("backend.api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
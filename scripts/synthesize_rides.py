@@ -17,6 +17,7 @@ REPO = Path(__file__).resolve().parents[1]
 DB_PATH = REPO / "db" / "uber_hackathon_v2.db"
 EXCEL_PATH = REPO / "data" / "uber_hackathon_v2_mock_data.xlsx"
 OUT_CSV = REPO / "data" / "rides_trips_synth.csv"
+HIST_STAMP = REPO / "db" / "hist_data.stamp"  # watched by backend/rating/anchors.py
 H3_RES = 8
 
 # Reasonable jitter in meters for pickup/drop (urban)
@@ -305,6 +306,7 @@ def write_db_append(df_new):
     # Show new count for sanity
     new_count = conn.execute("SELECT COUNT(*) FROM rides_trips").fetchone()[0]
     conn.close()
+    HIST_STAMP.touch()  # running API drops its cached rating anchors
     print(f"[synth] Appended {len(to_write)} rows into DB rides_trips (now {new_count})")
 
 
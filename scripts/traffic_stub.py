@@ -0,0 +1,115 @@
+"""
+Local stand-in for the Google Distance Matrix API, for development and load
+tests without a key or network access.
+
+    python scripts/traffic_stub.py --port 8765
+    TRAFFIC_API_URL=http://127.0.0.1:8765/maps/api/distancematrix/json \
+    GOOGLE_MAPS_API_KEY=stub python -m uvicorn backend.api:app --port 8000
+
+Answers any origins x destinations matrix ("lat,lng|lat,lng" lists) with a
+straight-line distance, a 30 km/h free-flow duration and a deterministic
+congestion factor (x1.4 in rush hours). --latency-ms simulates a slow upstream.
+
+Tests run make_handler() in-process on an ephemeral port and read what it
+saw: Handler.calls, Handler.sizes ([(n_origins, n_destinations)] per call);
+setting Handler.fail_status makes every answer that top-level error status.
+"""
+import argparse
+import json
+import math
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FREE_FLOW_KMH = 30.0
+
+
+def _km(a, b):
+    (lat1, lon1), (lat2, lon2) = a, b
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlmb / 2) ** 2
+    return 6371.0 * 2 * math.atan2(math.sqrt(h), math.sqrt(1 - h))
+
+
+def _points(s):
+    out = []
+    for part in (s or "").split("|"):
+        lat, lng = part.split(",")
+        out.append((float(lat), float(lng)))
+    return out
+
+
+def _congestion(hour):
+    return 1.4 if hour in (7, 8, 9, 16, 17, 18) else 1.1
+
+
+def matrix(origins, destinations, hour):
+    rows = []
+    for o in origins:
+        elements = []
+        for d in destinations:
+            km = _km(o, d)
+            secs = max(60, int(km / FREE_FLOW_KMH * 3600))
+            elements.append({
+                "status": "OK",
+                "distance": {"value": int(km * 1000), "text": f"{km:.1f} km"},
+                "duration": {"value": secs, "text": f"{secs // 60} mins"},
+                "duration_in_traffic": {"value": int(secs * _congestion(hour)), "text": ""},
+            })
+        rows.append({"elements": elements})
+    return {"status": "OK", "origin_addresses": [], "destination_addresses": [], "rows": rows}
+
+
+def make_handler(latency_ms):
+    class Handler(BaseHTTPRequestHandler):
+        calls = 0
+        sizes = []
+        fail_status = None
+
+        def do_GET(self):
+            Handler.calls += 1
+            qs = parse_qs(urlparse(self.path).query)
+            try:
+                origins = _points(qs.get("origins", [""])[0])
+                destinations = _points(qs.get("destinations", [""])[0])
+                Handler.sizes.append((len(origins), len(destinations)))
+                body = matrix(origins, destinations, datetime.now().hour)
+            except ValueError:
+                body = {"status": "INVALID_REQUEST", "rows": []}
+            if Handler.fail_status:
+                body = {"status": Handler.fail_status, "rows": []}
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Artificial delay per call")
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency_ms))
+    print(f"[traffic_stub] listening on http://{args.host}:{args.port}/maps/api/distancematrix/json")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
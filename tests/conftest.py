@@ -0,0 +1,45 @@
+# tests/conftest.py
+# Tests import the backend the same way scripts/ do: from the repo root.
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture
+def traffic_stub(request, monkeypatch):
+    """
+    scripts/traffic_stub.py serving on an ephemeral port, with the live
+    traffic path (backend/rating/traffic.py) pointed at it and its cache,
+    in-flight table, breaker and counters reset. Yields the stub's Handler
+    class (calls / sizes / fail_status). Parametrize indirectly with a
+    latency in ms to slow the stub down.
+    """
+    from scripts.traffic_stub import make_handler
+    from backend.rating import traffic
+
+    handler = make_handler(getattr(request, "param", 0))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(traffic, "BASE_URL", f"http://127.0.0.1:{server.server_port}/maps/api/distancematrix/json")
+    monkeypatch.setattr(traffic, "API_KEY", "stub")
+    monkeypatch.setattr(traffic, "MOCK_TRAFFIC", False)
+    monkeypatch.setattr(traffic, "TRAFFIC_SOURCE", "google")
+    monkeypatch.setattr(traffic, "_ASYNC_CLIENT", None)
+    traffic.clear_traffic_cache()
+    traffic._INFLIGHT.clear()
+    traffic._BREAKER.update(failures=0, open_until=0.0)
+    for k in traffic._STATS:
+        traffic._STATS[k] = 0
+    try:
+        yield handler
+    finally:
+        server.shutdown()
+        server.server_close()
+        traffic.clear_traffic_cache()
@@ -0,0 +1,129 @@
+# tests/test_scoring_parity.py
+# The array scorers (rate_rides / backtests) must agree with the scalar ones
+# rate_ride_async uses: same scores, same reason strings. Only pickup may
+# differ, by the last-ulp haversine difference documented in utils.
+import math
+
+import numpy as np
+import pytest
+
+from backend.rating.scoring import (
+    score_customer,
+    score_customer_array,
+    score_pickup,
+    score_pickup_array,
+    score_profitability,
+    score_profitability_array,
+    score_time,
+    score_time_array,
+)
+from backend.rating.utils import haversine_km, haversine_km_array, linear_scale, linear_scale_array
+
+RNG_SEED = 20251004
+AMS = (52.3702, 4.8952)
+KM_PER_DEG_LAT = 6371.0 * math.pi / 180
+
+ANCHOR_SETS = [
+    {"p25": 4.6, "p50": 4.8, "p75": 4.92},   # typical
+    {},                                      # defaults
+    {"p25": 20.0, "p50": 20.0, "p75": 20.0},  # hi == lo
+    {"p25": 40.0, "p50": 25.0, "p75": 10.0},  # hi < lo
+]
+
+
+def _assert_same(scalar_results, arr, ulps=0):
+    scores = [s for s, _ in scalar_results]
+    if ulps:
+        for a, b in zip(arr.scores.tolist(), scores):
+            assert abs(a - b) <= ulps * math.ulp(max(abs(a), abs(b), 1.0)), (a, b)
+    else:
+        assert arr.scores.tolist() == scores
+    assert arr.reasons() == [r for _, r in scalar_results]
+
+
+# --- utils ---
+
+@pytest.mark.parametrize("lo,hi", [(0.0, 0.5), (0.5, 2.0), (2.0, 5.0), (10.0, 40.0), (5.0, 5.0), (40.0, 10.0)])
+def test_linear_scale_parity(lo, hi):
+    rng = np.random.default_rng(RNG_SEED)
+    x = np.concatenate([[lo, hi, lo - 1, hi + 1, (lo + hi) / 2, 0.0], rng.uniform(-5, 50, 500)])
+    assert linear_scale_array(x, lo, hi, 100, 95).tolist() == [linear_scale(v, lo, hi, 100, 95) for v in x.tolist()]
+
+
+def test_haversine_parity_within_one_ulp():
+    rng = np.random.default_rng(RNG_SEED)
+    lat1, lon1 = rng.uniform(50, 54, 2000), rng.uniform(3, 7, 2000)
+    lat2, lon2 = lat1 + rng.normal(0, 0.05, 2000), lon1 + rng.normal(0, 0.05, 2000)
+    arr = haversine_km_array(lat1, lon1, lat2, lon2)
+    for i in range(len(arr)):
+        d = haversine_km(lat1[i], lon1[i], lat2[i], lon2[i])
+        assert abs(arr[i] - d) <= math.ulp(d), (i, arr[i], d)
+
+
+# --- pickup ---
+
+def _pickup_inputs():
+    rng = np.random.default_rng(RNG_SEED)
+    # due north of the driver at exactly the band edges (0.5 / 2 / 5 km), on
+    # either side of them, at 0 and far away; then random points
+    dists = [0.0, 0.5, 2.0, 5.0, 0.4999, 0.5001, 1.9999, 2.0001, 4.9999, 5.0001, 12.0]
+    d_lat = [AMS[0]] * len(dists) + rng.uniform(52.2, 52.5, 300).tolist()
+    d_lon = [AMS[1]] * len(dists) + rng.uniform(4.7, 5.1, 300).tolist()
+    p_lat = [AMS[0] + d / KM_PER_DEG_LAT for d in dists] + (np.array(d_lat[len(dists):]) + rng.normal(0, 0.03, 300)).tolist()
+    p_lon = [AMS[1]] * len(dists) + (np.array(d_lon[len(dists):]) + rng.normal(0, 0.03, 300)).tolist()
+    return d_lat, d_lon, p_lat, p_lon
+
+
+def test_pickup_parity():
+    d_lat, d_lon, p_lat, p_lon = _pickup_inputs()
+    scalar = [score_pickup(*args) for args in zip(d_lat, d_lon, p_lat, p_lon)]
+    _assert_same(scalar, score_pickup_array(d_lat, d_lon, p_lat, p_lon), ulps=1)
+
+
+# --- customer ---
+
+@pytest.mark.parametrize("anchors", ANCHOR_SETS[:2])
+def test_customer_parity(anchors):
+    rng = np.random.default_rng(RNG_SEED)
+    p25, p50, p75 = anchors.get("p25") or 4.6, anchors.get("p50") or 4.8, anchors.get("p75") or 4.92
+    ratings = [p25, p50, p75, 1.0, 5.0, 5.2, 0.5, None] + np.round(rng.uniform(3.5, 5.0, 300), 2).tolist()
+    scalar = [score_customer(r, anchors) for r in ratings]
+    arr = score_customer_array([np.nan if r is None else r for r in ratings], anchors)
+    _assert_same(scalar, arr)
+
+
+def test_customer_nan_is_neutral():
+    arr = score_customer_array([np.nan], {})
+    assert arr.scores.tolist() == [70.0]
+    assert arr.reason(0) == score_customer(None, {})[1] == "No rider rating"
+
+
+# --- time ---
+
+@pytest.mark.parametrize("anchors", ANCHOR_SETS)
+def test_time_parity(anchors):
+    rng = np.random.default_rng(RNG_SEED)
+    p25, p75 = anchors.get("p25") or 10.0, anchors.get("p75") or 40.0
+    durations = [p25, p75, 0.0, 1.0, (p25 + p75) / 2, 120.0] + rng.integers(1, 90, 300).astype(float).tolist()
+    scalar = [score_time(anchors, d) for d in durations]
+    _assert_same(scalar, score_time_array(anchors, durations))
+
+
+# --- profitability ---
+
+@pytest.mark.parametrize("anchors", [{"p25": 0.3, "p75": 0.6}, {}, {"p25": 0.5, "p75": 0.5}, {"p25": 0.6, "p75": 0.3}])
+def test_profitability_parity(anchors):
+    rng = np.random.default_rng(RNG_SEED)
+    p25, p75 = anchors.get("p25") or 0.25, anchors.get("p75") or 0.45
+    # npm exactly at P25 / P75 (est_net = 1.2 * km at surge 1, over 10 min)
+    dist = [p25 * 10 / 1.2, p75 * 10 / 1.2, 5.0, 5.0, 5.0, 0.0] + rng.uniform(0.5, 25, 300).tolist()
+    dur = [10.0, 10.0, 0.0, -3.0, 12.0, 10.0] + rng.integers(0, 60, 300).astype(float).tolist()
+    surge = [1.0, 1.0, 1.0, 1.0, 0.0, 1.0] + rng.choice([1.0, 1.2, 1.5, 2.0], 300).tolist()
+    scalar = [score_profitability(anchors, k, m, surge_mult=s) for k, m, s in zip(dist, dur, surge)]
+    _assert_same(scalar, score_profitability_array(anchors, dist, dur, np.array(surge)))
+
+
+def test_profitability_scalar_surge_broadcasts():
+    dist, dur = [3.0, 8.0], [10.0, 0.0]
+    scalar = [score_profitability({}, k, m, surge_mult=1.5) for k, m in zip(dist, dur)]
+    _assert_same(scalar, score_profitability_array({}, dist, dur, 1.5))
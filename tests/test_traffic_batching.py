@@ -0,0 +1,101 @@
+# tests/test_traffic_batching.py
+# Batched Distance Matrix calls against the local stub: pairs are grouped by
+# shared pickup / drop cell only, so every billed element is a requested
+# cache key, calls respect the element limits, and each pair gets its answer.
+from datetime import datetime
+
+import h3
+
+from backend.rating import traffic
+from scripts.traffic_stub import matrix
+
+AMS = (52.3702, 4.8952)
+STEP = 0.02  # degrees; well over one H3 res-8 cell, so every pair is its own cache key
+
+
+def _point(i, j=0):
+    return AMS[0] + i * STEP, AMS[1] + j * STEP
+
+
+def _expected(pair):
+    """What a lone 1 x 1 call to the stub would answer for this pair."""
+    body = matrix([pair[:2]], [pair[2:]], datetime.now().hour)
+    return traffic._element_result(body["rows"][0]["elements"][0])[0]
+
+
+def test_distinct_pairs_are_not_cross_multiplied(traffic_stub):
+    pairs = [(*_point(i, 0), *_point(i, 10)) for i in range(10)]
+    traffic.score_traffic_many(pairs)
+    assert traffic_stub.calls == 10
+    assert traffic_stub.sizes == [(1, 1)] * 10  # 10 billed elements, not 100
+
+
+def _near(cell, i):
+    """A point ~50 m off the cell centre: same cell, different coordinates."""
+    lat, lng = h3.cell_to_latlng(cell)
+    return lat + 0.0004 * ((i % 5) - 2) / 2, lng + 0.0006 * ((i % 7) - 3) / 3
+
+
+def test_clustered_pickups_batch_by_cell(traffic_stub):
+    zones = [h3.latlng_to_cell(*_point(z, 0), traffic.TRAFFIC_H3_RES) for z in range(3)]
+    pairs = [(*_near(zones[z], i), *_point(i, 10 + z)) for z in range(3) for i in range(50)]
+    assert len({p[:2] for p in pairs}) > 3  # not identical pickup strings
+    assert {h3.latlng_to_cell(*p[:2], traffic.TRAFFIC_H3_RES) for p in pairs} == set(zones)
+
+    results = traffic.score_traffic_many(pairs)
+    per_row = traffic.TRAFFIC_MAX_DESTINATIONS
+    assert traffic_stub.sizes == [(1, per_row)] * 6  # 150 offers, 3 zones -> 6 calls, not 150
+    assert sum(o * d for o, d in traffic_stub.sizes) == len(pairs)
+    # each zone is asked from its first offer's pickup; the answer is per cell pair
+    for z in range(3):
+        rep = pairs[z * 50][:2]
+        zone = pairs[z * 50:(z + 1) * 50]
+        assert results[z * 50:(z + 1) * 50] == [_expected((*rep, *p[2:])) for p in zone]
+
+
+def test_shared_pickup_goes_out_as_one_by_n(traffic_stub):
+    pickup = _point(0)
+    pairs = [(*pickup, *_point(i, 5)) for i in range(1, 31)]
+    results = traffic.score_traffic_many(pairs)
+    assert traffic_stub.calls == 2
+    assert traffic_stub.sizes == [(1, traffic.TRAFFIC_MAX_DESTINATIONS), (1, 30 - traffic.TRAFFIC_MAX_DESTINATIONS)]
+    assert results == [_expected(p) for p in pairs]
+
+
+def test_shared_drop_goes_out_as_n_by_one(traffic_stub):
+    drop = _point(0, 20)
+    pairs = [(*_point(i, 0), *drop) for i in range(1, 8)]
+    results = traffic.score_traffic_many(pairs)
+    assert traffic_stub.sizes == [(7, 1)]
+    assert results == [_expected(p) for p in pairs]
+
+
+def test_billed_elements_equal_requested_pairs(traffic_stub):
+    hub, sink = _point(0), _point(0, 30)
+    pairs = (
+        [(*hub, *_point(i, 5)) for i in range(1, 6)]        # 1 x 5
+        + [(*_point(i, 10), *sink) for i in range(1, 4)]    # 3 x 1
+        + [(*_point(i, 15), *_point(i, 25)) for i in range(1, 3)]  # 2 lone pairs
+    )
+    results = traffic.score_traffic_many(pairs)
+    assert sum(o * d for o, d in traffic_stub.sizes) == len(pairs)
+    assert sorted(traffic_stub.sizes) == [(1, 1), (1, 1), (1, 5), (3, 1)]
+    assert results == [_expected(p) for p in pairs]  # per-pair fan-out, input order
+
+
+def test_calls_respect_element_limits(traffic_stub, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_MAX_ELEMENTS", 4)
+    monkeypatch.setattr(traffic, "TRAFFIC_MAX_ORIGINS", 3)
+    hub, sink = _point(0), _point(0, 30)
+    pairs = [(*hub, *_point(i, 5)) for i in range(1, 11)] + [(*_point(i, 10), *sink) for i in range(1, 8)]
+    results = traffic.score_traffic_many(pairs)
+    assert all(o <= 3 and d <= 4 and o * d <= 4 for o, d in traffic_stub.sizes)
+    assert sorted(traffic_stub.sizes) == [(1, 1), (1, 2), (1, 4), (1, 4), (3, 1), (3, 1)]
+    assert results == [_expected(p) for p in pairs]
+
+
+def test_duplicates_in_one_batch_fetch_once(traffic_stub):
+    pair = (*_point(0), *_point(0, 5))
+    results = traffic.score_traffic_many([pair] * 5)
+    assert traffic_stub.calls == 1 and traffic_stub.sizes == [(1, 1)]
+    assert results == [_expected(pair)] * 5
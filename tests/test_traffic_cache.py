@@ -0,0 +1,118 @@
+# tests/test_traffic_cache.py
+# Traffic result cache and in-flight coalescing, against the local stub:
+# hits within one (pickup cell, drop cell, 15-min bucket), TTL / LRU
+# eviction, one upstream call for N concurrent identical misses, and
+# failed lookups never cached.
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.rating import traffic
+
+PICKUP = (52.3702, 4.8952)
+DROP = (52.3600, 4.9300)
+PAIR = (*PICKUP, *DROP)
+
+
+def _pair(i):
+    return (PICKUP[0] + 0.02 * i, PICKUP[1], *DROP)
+
+
+def test_hit_within_one_bucket(traffic_stub):
+    first = traffic.score_traffic(*PAIR)
+    # a few metres away: same H3 cells, same 15-minute bucket
+    again = traffic.score_traffic(PICKUP[0] + 0.0001, PICKUP[1] + 0.0001, DROP[0], DROP[1] - 0.0001)
+    assert again == first
+    assert traffic_stub.calls == 1
+    stats = traffic.traffic_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_next_bucket_is_a_new_key():
+    now = time.time()
+    bucket_start = now - now % traffic.TRAFFIC_BUCKET_S
+    assert traffic._cache_key(*PAIR, now=bucket_start) == traffic._cache_key(*PAIR, now=bucket_start + traffic.TRAFFIC_BUCKET_S - 1)
+    assert traffic._cache_key(*PAIR, now=bucket_start) != traffic._cache_key(*PAIR, now=bucket_start + traffic.TRAFFIC_BUCKET_S)
+
+
+def test_ttl_expiry(traffic_stub, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_CACHE_TTL_S", 0.05)
+    traffic.score_traffic(*PAIR)
+    traffic.score_traffic(*PAIR)
+    assert traffic_stub.calls == 1
+    time.sleep(0.1)
+    traffic.score_traffic(*PAIR)
+    assert traffic_stub.calls == 2
+
+
+def test_lru_eviction(traffic_stub, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_CACHE_SIZE", 2)
+    a, b, c = _pair(1), _pair(2), _pair(3)
+    traffic.score_traffic(*a)
+    traffic.score_traffic(*b)
+    traffic.score_traffic(*a)  # hit; b is now least recently used
+    traffic.score_traffic(*c)  # evicts b
+    assert traffic_stub.calls == 3
+    traffic.score_traffic(*a)
+    assert traffic_stub.calls == 3
+    traffic.score_traffic(*b)
+    assert traffic_stub.calls == 4
+    assert traffic.traffic_cache_stats()["size"] == 2
+
+
+@pytest.mark.parametrize("traffic_stub", [200], indirect=True)
+def test_concurrent_identical_misses_one_upstream_call(traffic_stub):
+    n = 20
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        results[i] = traffic.score_traffic(*PAIR)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert traffic_stub.calls == 1
+    assert len(set(results)) == 1 and results[0][0] != 70.0
+    stats = traffic.traffic_cache_stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == n - 1
+
+
+@pytest.mark.parametrize("traffic_stub", [200], indirect=True)
+def test_concurrent_identical_misses_async(traffic_stub):
+    async def run():
+        try:
+            return await asyncio.gather(*(traffic.score_traffic_async(*PAIR) for _ in range(20)))
+        finally:
+            await traffic.close_async_client()
+
+    results = asyncio.run(run())
+    assert traffic_stub.calls == 1
+    assert len(set(results)) == 1
+
+
+def test_errors_are_not_cached(traffic_stub):
+    traffic_stub.fail_status = "OVER_QUERY_LIMIT"
+    score, reason = traffic.score_traffic(*PAIR)
+    assert (score, reason) == (70.0, "Traffic API status OVER_QUERY_LIMIT")
+    traffic.score_traffic(*PAIR)
+    assert traffic_stub.calls == 2  # the failure was not served from cache
+    assert traffic.traffic_cache_stats()["size"] == 0
+
+    traffic_stub.fail_status = None
+    score, reason = traffic.score_traffic(*PAIR)
+    assert score != 70.0 and reason.startswith("Traffic ") and "API" not in reason
+    traffic.score_traffic(*PAIR)
+    assert traffic_stub.calls == 3  # the success was
+
+
+def test_unreachable_upstream_is_not_cached(traffic_stub, monkeypatch):
+    monkeypatch.setattr(traffic, "BASE_URL", "http://127.0.0.1:9/unreachable")
+    score, reason = traffic.score_traffic(*PAIR)
+    assert score == 70.0 and reason.startswith("Traffic API error")
+    assert traffic.traffic_cache_stats()["size"] == 0
@@ -0,0 +1,93 @@
+# tests/test_traffic_resilience.py
+# Async deadline and circuit breaker of the live traffic path, against the
+# local stub: a slow provider costs a rating at most TRAFFIC_DEADLINE_S and a
+# neutral 70 (also for callers coalescing onto someone else's lookup), and
+# repeated failures open the breaker until the cooldown has passed.
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.rating import traffic
+
+PAIR = (52.3702, 4.8952, 52.3600, 4.9300)
+DEADLINE_S = 0.2
+
+
+def _run_async(*pair):
+    async def run():
+        try:
+            t0 = time.perf_counter()
+            result = await traffic.score_traffic_async(*pair)
+            return result, time.perf_counter() - t0
+        finally:
+            await traffic.close_async_client()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def short_deadline(monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_DEADLINE_S", DEADLINE_S)
+
+
+@pytest.mark.parametrize("traffic_stub", [800], indirect=True)
+def test_deadline_answers_neutral(traffic_stub, short_deadline):
+    (score, reason), took = _run_async(*PAIR)
+    assert score == 70.0 and "deadline" in reason
+    assert took < DEADLINE_S + 0.3
+    stats = traffic.traffic_cache_stats()
+    assert stats["deadline_exceeded"] == 1 and stats["size"] == 0  # not cached
+
+
+@pytest.mark.parametrize("traffic_stub", [800], indirect=True)
+def test_deadline_applies_to_coalesced_waiters(traffic_stub, short_deadline):
+    owner_result = []
+    owner = threading.Thread(target=lambda: owner_result.append(traffic.score_traffic(*PAIR)))
+    owner.start()  # sync batch-style owner: waits for the full upstream call
+    while not traffic._INFLIGHT:
+        time.sleep(0.005)
+
+    (score, reason), took = _run_async(*PAIR)
+    assert score == 70.0 and "deadline" in reason
+    assert took < DEADLINE_S + 0.3
+    assert traffic.traffic_cache_stats()["coalesced"] == 1
+
+    owner.join()
+    assert owner_result[0][0] != 70.0  # the owner still got (and cached) the real answer
+    assert traffic.traffic_cache_stats()["deadline_exceeded"] == 1
+    assert traffic.score_traffic(*PAIR) == owner_result[0]
+    assert traffic_stub.calls == 1
+
+
+def test_breaker_opens_and_cools_down(traffic_stub, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(traffic, "TRAFFIC_BREAKER_COOLDOWN_S", 0.2)
+    traffic_stub.fail_status = "UNKNOWN_ERROR"
+
+    traffic.score_traffic(*PAIR)
+    traffic.score_traffic(*PAIR)
+    assert traffic_stub.calls == 2
+    assert traffic.traffic_cache_stats()["breaker_open"]
+
+    # open: neither the sync nor the async path goes upstream
+    assert traffic.score_traffic(*PAIR) == (70.0, traffic.BREAKER_OPEN_REASON)
+    assert _run_async(*PAIR)[0] == (70.0, traffic.BREAKER_OPEN_REASON)
+    assert traffic_stub.calls == 2
+    assert traffic.traffic_cache_stats()["breaker_skips"] == 2
+
+    time.sleep(0.25)  # cooldown over, provider healthy again
+    traffic_stub.fail_status = None
+    score, _ = traffic.score_traffic(*PAIR)
+    assert score != 70.0 and traffic_stub.calls == 3
+    stats = traffic.traffic_cache_stats()
+    assert not stats["breaker_open"] and stats["consecutive_failures"] == 0
+
+
+@pytest.mark.parametrize("traffic_stub", [800], indirect=True)
+def test_deadline_misses_count_towards_the_breaker(traffic_stub, short_deadline, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_BREAKER_FAILURES", 2)
+    _run_async(*PAIR)
+    _run_async(*PAIR)
+    assert traffic.traffic_cache_stats()["breaker_open"]
+    assert _run_async(*PAIR)[0] == (70.0, traffic.BREAKER_OPEN_REASON)